@@ -0,0 +1,151 @@
+"""
+Admission control for frame analysis
+Bounds how many frames run inference at once and how many may wait for it.
+Waiting frames are served by priority (sessions with open high-severity
+violations first), each exam may have only one frame in flight, and frames
+beyond the queue bound are rejected immediately with a retry hint instead
+of piling up until the browser times out.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+from contextlib import asynccontextmanager
+
+from metrics import registry
+from timing import LatencyWindow
+
+# Priorities, lower is served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+admission_decisions = registry.counter(
+    'proctoring_admission_total',
+    'Frame analysis admission decisions',
+    ['decision']
+)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after, status_code):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class AdmissionController:
+    def __init__(self, concurrency=None, max_waiting=None):
+        if concurrency is None:
+            concurrency = int(os.getenv('ANALYSIS_CONCURRENCY', os.getenv('INFERENCE_FRAME_SLOTS', 8)))
+        if max_waiting is None:
+            max_waiting = int(os.getenv('ANALYSIS_QUEUE_MAX', 64))
+
+        self.concurrency = max(1, concurrency)
+        self.max_waiting = max_waiting
+
+        self.running = 0
+        self._waiting = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._inflight_exams = set()
+
+        self.service_time = LatencyWindow(size=200)
+        self.served = 0
+        self.rejected_full = 0
+        self.rejected_busy = 0
+
+    def waiting(self):
+        return len(self._waiting)
+
+    def _retry_after(self):
+        """Seconds until the current backlog has likely drained"""
+        average = self.service_time.total / self.service_time.count if self.service_time.count else 0.5
+        backlog = (len(self._waiting) + self.running) / self.concurrency
+        return max(1, math.ceil(backlog * average))
+
+    def check(self, exam_id):
+        """Reject early, before any work is spent on the frame"""
+        if exam_id is not None and exam_id in self._inflight_exams:
+            self.rejected_busy += 1
+            admission_decisions.inc(decision='rejected_busy')
+            raise AdmissionRejected("A frame for this exam is already being analyzed", 1, 429)
+
+        if self.running >= self.concurrency and len(self._waiting) >= self.max_waiting:
+            self.rejected_full += 1
+            admission_decisions.inc(decision='rejected_full')
+            raise AdmissionRejected("Analysis queue is full", self._retry_after(), 503)
+
+    @asynccontextmanager
+    async def admit(self, exam_id, priority=PRIORITY_NORMAL):
+        """Hold one analysis slot for the duration of the block"""
+        self.check(exam_id)
+        if exam_id is not None:
+            self._inflight_exams.add(exam_id)
+
+        try:
+            if self.running < self.concurrency and not self._waiting:
+                self.running += 1
+            else:
+                future = asyncio.get_running_loop().create_future()
+                entry = (priority, next(self._sequence), future)
+                heapq.heappush(self._waiting, entry)
+                try:
+                    # The releasing request hands its slot over by resolving this
+                    await future
+                except asyncio.CancelledError:
+                    if future.done() and not future.cancelled():
+                        # Slot was handed over just before cancellation
+                        self._release()
+                    elif entry in self._waiting:
+                        # A release may already have popped the cancelled entry
+                        self._waiting.remove(entry)
+                        heapq.heapify(self._waiting)
+                    raise
+
+            admission_decisions.inc(decision='served')
+            self.served += 1
+            with self.service_time.time():
+                try:
+                    yield
+                finally:
+                    self._release()
+        finally:
+            if exam_id is not None:
+                self._inflight_exams.discard(exam_id)
+
+    def _release(self):
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                # Hand the slot straight to the next waiter
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    def stats(self):
+        return {
+            'concurrency': self.concurrency,
+            'max_waiting': self.max_waiting,
+            'running': self.running,
+            'waiting': len(self._waiting),
+            'served': self.served,
+            'rejected_full': self.rejected_full,
+            'rejected_busy': self.rejected_busy
+        }
+
+
+# Global admission controller instance
+admission = AdmissionController()
+
+registry.gauge(
+    'proctoring_admission_waiting',
+    'Frames waiting for an analysis slot',
+    function=admission.waiting
+)
+registry.gauge(
+    'proctoring_admission_running',
+    'Frames holding an analysis slot',
+    function=lambda: admission.running
+)
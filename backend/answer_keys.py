@@ -0,0 +1,88 @@
+"""
+In-memory answer-key cache
+submit_answer used to read the correct answer of a question from MySQL
+before inserting the user's answer. The answer of every question is kept
+here instead, one byte per question id in a bytearray (0 = not cached), so
+scoring an answer needs no database round trip. The cache is filled in
+bulk on startup, updated when questions are inserted, and reads through to
+the database on a miss.
+"""
+
+from database import async_db
+from metrics import registry
+
+answer_key_lookups = registry.counter(
+    'answer_key_lookups_total',
+    'Answer-key cache lookups by outcome',
+    ['outcome']
+)
+
+# Also EXPLAINed by migrate.py --check
+LOOKUP_QUERY = "SELECT correct_answer FROM questions WHERE id = %s"
+
+
+class AnswerKeyCache:
+    def __init__(self):
+        # Index = question id, value = ASCII code of the correct answer
+        self.keys = bytearray()
+        self.cached = 0
+        self.hits = 0
+        self.misses = 0
+
+    def set(self, question_id, correct_answer):
+        """Cache the answer of a question (single-character answers only)"""
+        if question_id < 0 or not correct_answer or len(correct_answer) != 1:
+            return
+        code = ord(correct_answer)
+        if code > 255:
+            return
+
+        if question_id >= len(self.keys):
+            # Grow geometrically so bulk loads in id order stay linear
+            self.keys.extend(bytes(max(question_id + 1, len(self.keys) * 2) - len(self.keys)))
+        if not self.keys[question_id]:
+            self.cached += 1
+        self.keys[question_id] = code
+
+    def get(self, question_id):
+        """Cached answer of a question, or None"""
+        if 0 <= question_id < len(self.keys) and self.keys[question_id]:
+            return chr(self.keys[question_id])
+        return None
+
+    async def warm_up(self):
+        """Load every answer key (raises on database errors, so readiness reports the failure)"""
+        rows = await async_db.fetch_all("SELECT id, correct_answer FROM questions", raise_errors=True)
+        for row in rows:
+            self.set(row['id'], row['correct_answer'])
+        print(f"✅ Answer-key cache ready: {self.cached} questions ({len(self.keys)} bytes)")
+
+    async def lookup(self, question_id):
+        """Correct answer of a question, from the cache or else the database"""
+        correct_answer = self.get(question_id)
+        if correct_answer is not None:
+            self.hits += 1
+            answer_key_lookups.inc(outcome='hit')
+            return correct_answer
+
+        self.misses += 1
+        answer_key_lookups.inc(outcome='miss')
+        result = await async_db.fetch_one(LOOKUP_QUERY, (question_id,))
+        if not result:
+            return None
+        self.set(question_id, result['correct_answer'])
+        return result['correct_answer']
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'cached': self.cached,
+            'bytes': len(self.keys),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Global answer-key cache instance
+answer_keys = AnswerKeyCache()
@@ -0,0 +1,258 @@
+"""
+Proctoring pipeline micro-benchmark
+Replays a fixed corpus of frames through the methods the inference workers
+run (FaceProctoring.analyze_rgb with its detection/mesh cascade, batched RGB
+object detection, summary generation) and reports throughput and
+p50/p95/p99 latency per stage as JSON, grouped by resolution and face count.
+
+Frames come from a fixture directory laid out as
+    <fixtures>/<resolution>/<n>_faces/*.jpg     e.g. 720p/1_faces/desk.jpg
+holding photos of real people (the default is benchmark_frames/ next to
+this script). Before timing, every fixture is checked to contain the number
+of faces its directory promises, so the face groups really exercise the
+face paths. Loose JPEGs in the directory are timed as the 'recorded' group.
+Without fixtures a synthetic corpus is used, which the face detector does
+not reliably see as faces; it only measures the no-face path.
+
+Usage:
+    python benchmark.py                                  # fixtures or synthetic corpus
+    python benchmark.py --frames ../recordings/frames    # another fixture directory
+    python benchmark.py --save-baseline                  # store current numbers
+    python benchmark.py --check                          # fail on regressions
+
+The run exits with status 2 when a fixture does not show its face count,
+and with status 1 when a stage that must run for a group recorded no
+samples, or (with --check) when any stage's p95 is more than --tolerance
+above the stored baseline.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from face_proctoring import FaceProctoring
+from frame_decode import FrameDecoder
+from object_detection import ObjectDetection
+from timing import LatencyWindow
+
+RESOLUTIONS = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080)
+}
+FACE_COUNTS = [0, 1, 2]
+STAGES = ['decode', 'face_analysis', 'face_detection', 'mesh', 'object_detection', 'summary']
+# Stages every frame goes through; the mesh must also run for single faces
+REQUIRED_STAGES = ['decode', 'face_analysis', 'face_detection', 'object_detection', 'summary']
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_frames')
+
+
+def synthetic_frame(width, height, face_count, seed=0):
+    """A noisy background with simple drawn faces, deterministic per seed"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(60, 120, size=(height, width, 3), dtype=np.uint8)
+
+    for i in range(face_count):
+        center = (int(width * (i + 1) / (face_count + 1)), height // 2)
+        axes = (width // 10, height // 5)
+        cv2.ellipse(frame, center, axes, 0, 0, 360, (150, 180, 220), -1)
+        eye_y = center[1] - axes[1] // 4
+        for dx in (-axes[0] // 2, axes[0] // 2):
+            cv2.circle(frame, (center[0] + dx, eye_y), axes[0] // 8, (40, 40, 40), -1)
+        cv2.ellipse(frame, (center[0], center[1] + axes[1] // 2), (axes[0] // 3, axes[1] // 10),
+                    0, 0, 180, (60, 60, 160), -1)
+    return frame
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def build_corpus(frames_dir=None):
+    """
+    List of (group, expected face count or None, label, encoded JPEG bytes)
+    Fixture groups are <resolution>/<n>_faces; without fixtures, synthetic
+    frames are grouped as <resolution>/synthetic with no expected count
+    """
+    corpus = []
+    if frames_dir and os.path.isdir(frames_dir):
+        for path in sorted(glob.glob(os.path.join(frames_dir, '*', '*_faces', '*.jpg'))):
+            faces_dir = os.path.basename(os.path.dirname(path))
+            resolution = os.path.basename(os.path.dirname(os.path.dirname(path)))
+            match = re.match(r'(\d+)_faces$', faces_dir)
+            if match:
+                expected = int(match.group(1))
+                corpus.append((f"{resolution}/{faces_dir}", expected, path, _read(path)))
+        for path in sorted(glob.glob(os.path.join(frames_dir, '*.jpg'))):
+            corpus.append(('recorded', None, path, _read(path)))
+
+    if not any(expected is not None for _, expected, _, _ in corpus):
+        print("No face fixtures found, timing a synthetic corpus (no-face path only)", file=sys.stderr)
+        for name, (width, height) in RESOLUTIONS.items():
+            for face_count in FACE_COUNTS:
+                frame = synthetic_frame(width, height, face_count, seed=face_count)
+                ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                if ok:
+                    corpus.append((f"{name}/synthetic", None, f"synthetic {name} #{face_count}",
+                                   encoded.tobytes()))
+    return corpus
+
+
+def verify_corpus(corpus):
+    """Labels of fixtures whose detected face count differs from their directory"""
+    decoder = FrameDecoder()
+    face_proctoring = FaceProctoring()
+    mismatches = []
+    try:
+        for _, expected, label, data in corpus:
+            if expected is None:
+                continue
+            rgb_frame = cv2.cvtColor(decoder.decode(data), cv2.COLOR_BGR2RGB)
+            detected = face_proctoring.analyze_rgb(rgb_frame)['face_count']
+            face_proctoring.reset_state()
+            if detected != expected:
+                mismatches.append(f"{label}: expected {expected} faces, detected {detected}")
+    finally:
+        face_proctoring.close()
+    return mismatches
+
+
+def missing_stages(report, corpus):
+    """(group, stage) pairs that must have run for a group but recorded nothing"""
+    expected_faces = {group: expected for group, expected, _, _ in corpus}
+    missing = []
+    for group, stages in report['groups'].items():
+        required = list(REQUIRED_STAGES)
+        if expected_faces.get(group) == 1:
+            required.append('mesh')
+        missing.extend((group, stage) for stage in required if not stages[stage]['count'])
+    return missing
+
+
+def run_benchmark(corpus, iterations):
+    object_detection = ObjectDetection()
+    decoder = FrameDecoder()
+    # One tracker per corpus frame, like the per-exam sessions of the workers,
+    # so the cascade skips stages exactly as it would on a live stream
+    trackers = [FaceProctoring() for _ in corpus]
+
+    groups = {}
+    for group, _, _, _ in corpus:
+        groups.setdefault(group, {stage: LatencyWindow(size=len(corpus) * iterations) for stage in STAGES})
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for (group, _, _, data), face_proctoring in zip(corpus, trackers):
+            windows = groups[group]
+
+            # Decode plus the BGR to RGB conversion done while filling a frame slot
+            with windows['decode'].time():
+                frame = decoder.decode(data)
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+            with windows['face_analysis'].time():
+                face_violations = face_proctoring.analyze_rgb(rgb_frame)
+            # Stages the cascade actually ran on this frame
+            for stage, seconds in face_proctoring.timings.items():
+                if stage in windows:
+                    windows[stage].record(seconds)
+
+            with windows['object_detection'].time():
+                object_violations = object_detection.detect_objects_batch([rgb_frame], rgb=True)[0]
+
+            with windows['summary'].time():
+                face_proctoring.get_violation_summary(face_violations)
+                object_detection.get_violation_message(object_violations)
+    elapsed = time.perf_counter() - started
+
+    report = {'iterations': iterations, 'frames': len(corpus) * iterations, 'groups': {}}
+    for group, windows in groups.items():
+        report['groups'][group] = {}
+        for stage, window in windows.items():
+            summary = window.summary()
+            summary['throughput_fps'] = round(window.count / window.total, 1) if window.total else 0.0
+            report['groups'][group][stage] = summary
+    report['end_to_end_fps'] = round(report['frames'] / elapsed, 1)
+
+    for face_proctoring in trackers:
+        face_proctoring.close()
+    return report
+
+
+def find_regressions(report, baseline, tolerance):
+    """Stages whose p95 exceeds the baseline p95 by more than tolerance"""
+    regressions = []
+    for group, stages in baseline.get('groups', {}).items():
+        for stage, expected in stages.items():
+            actual = report['groups'].get(group, {}).get(stage)
+            if actual is None or not expected.get('p95_ms'):
+                continue
+            limit = expected['p95_ms'] * (1 + tolerance)
+            if actual['p95_ms'] > limit:
+                regressions.append({
+                    'group': group,
+                    'stage': stage,
+                    'p95_ms': actual['p95_ms'],
+                    'baseline_p95_ms': expected['p95_ms'],
+                    'limit_ms': round(limit, 2)
+                })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Proctoring pipeline micro-benchmark')
+    parser.add_argument('--frames', help='fixture directory (default: benchmark_frames/)')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write this run as the baseline')
+    parser.add_argument('--check', action='store_true', help='fail when a stage regresses')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 increase (0.2 = 20%%)')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.frames or DEFAULT_FIXTURES)
+    mismatches = verify_corpus(corpus)
+    if mismatches:
+        for mismatch in mismatches:
+            print(f"Fixture check failed: {mismatch}", file=sys.stderr)
+        return 2
+
+    report = run_benchmark(corpus, args.iterations)
+
+    exit_code = 0
+    report['missing_stages'] = [f"{group}: {stage}" for group, stage in missing_stages(report, corpus)]
+    if report['missing_stages']:
+        exit_code = 1
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"Baseline not found: {args.baseline}", file=sys.stderr)
+            return 2
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['regressions'] = find_regressions(report, baseline, args.tolerance)
+        if report['regressions']:
+            exit_code = 1
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(output)
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Load-adaptive capture interval and capture profile
+Every analysis result carries the interval after which the browser should
+send its next frame. The interval spreads a global frames-per-second budget
+over the active exams, stretches when inference queues build up, and
+shrinks for students with recent violations so risky sessions are sampled
+more often. Violation episodes stretch their gap with the capture interval,
+so slow capture under load does not split episodes.
+
+The capture profile tells browsers how large, and at which JPEG quality, to
+encode frames, so they upload what the models consume instead of full
+camera resolution.
+"""
+
+import os
+import time
+
+from frame_decode import frame_decoder
+from inference_pool import inference_pool
+
+
+class CapturePolicy:
+    def __init__(self, fps_budget=None, min_ms=None, max_ms=None, default_ms=None,
+                 jpeg_quality=None, grayscale=None):
+        if fps_budget is None:
+            fps_budget = float(os.getenv('CAPTURE_FPS_BUDGET', 100))
+        if min_ms is None:
+            min_ms = int(os.getenv('CAPTURE_MIN_MS', 1000))
+        if max_ms is None:
+            max_ms = int(os.getenv('CAPTURE_MAX_MS', 10000))
+        if default_ms is None:
+            default_ms = int(os.getenv('CAPTURE_DEFAULT_MS', 3000))
+        if jpeg_quality is None:
+            jpeg_quality = float(os.getenv('CAPTURE_JPEG_QUALITY', 0.7))
+        if grayscale is None:
+            grayscale = os.getenv('CAPTURE_GRAYSCALE', 'false').lower() == 'true'
+
+        # Frames per second the whole deployment should analyze at most
+        self.fps_budget = fps_budget
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.default_ms = default_ms
+        self.jpeg_quality = jpeg_quality
+        # Gray frames drop the chroma planes, at some cost in detection accuracy
+        self.grayscale = grayscale
+
+        # Sessions that sent nothing for this long no longer count as active
+        self.active_window = 30.0
+        # Queued frames per worker above which capture slows down
+        self.queue_per_worker = 2
+        # Decay of the per-exam risk score on each frame
+        self.risk_decay = 0.8
+
+        # exam_id -> [last_seen, risk]
+        self.sessions = {}
+        self._last_prune = 0.0
+
+    def _active_sessions(self, now):
+        # Pruning walks every session, so do it at most once a second
+        if now - self._last_prune > 1.0:
+            self._last_prune = now
+            stale = [exam_id for exam_id, (last_seen, _) in self.sessions.items()
+                     if now - last_seen > self.active_window]
+            for exam_id in stale:
+                del self.sessions[exam_id]
+        return max(1, len(self.sessions))
+
+    def recommend(self, exam_id, violations):
+        """Next capture interval for an exam, in milliseconds"""
+        if exam_id is None:
+            return self.default_ms
+
+        now = time.monotonic()
+        _, risk = self.sessions.get(exam_id, (now, 0.0))
+        risk = risk * self.risk_decay + (1.0 if violations else 0.0)
+        self.sessions[exam_id] = [now, risk]
+
+        # Share the global budget across the active sessions
+        interval = max(self.default_ms, self._active_sessions(now) / self.fps_budget * 1000)
+
+        # Back off while the inference workers are behind
+        capacity = max(1, len(inference_pool.workers)) * self.queue_per_worker
+        queued = inference_pool.pending_frames() + inference_pool.batcher.queue_depth()
+        if queued > capacity:
+            interval *= queued / capacity
+
+        # Sample students with recent violations twice as often
+        if risk > 0.5:
+            interval /= 2
+
+        return int(min(self.max_ms, max(self.min_ms, interval)))
+
+    def profile(self):
+        """How browsers should encode frames for the active models"""
+        # Frames larger than both the decoder target and the object
+        # detector input are downscaled on the server anyway
+        max_side = max(frame_decoder.target_size, inference_pool.detector_input_size or 0)
+        return {
+            'max_side': max_side,
+            'jpeg_quality': self.jpeg_quality,
+            'grayscale': self.grayscale,
+            'interval_ms': self.default_ms
+        }
+
+    def release(self, exam_id):
+        self.sessions.pop(exam_id, None)
+
+
+# Global capture policy instance
+capture_policy = CapturePolicy()
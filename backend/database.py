@@ -1,74 +1,294 @@
+import asyncio
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, InterfaceError, OperationalError, PoolError, errorcode, pooling
 import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
 from dotenv import load_dotenv
 
+from metrics import registry
+from timing import LatencyWindow
+
 load_dotenv()
 
+query_seconds = registry.histogram(
+    'db_query_seconds',
+    'Latency of SQL statements by operation and table',
+    ['statement']
+)
+query_errors = registry.counter(
+    'db_query_errors_total',
+    'SQL statements that raised an error',
+    ['statement']
+)
+pool_wait_seconds = registry.histogram(
+    'db_pool_wait_seconds',
+    'Time spent waiting to check out a pooled connection'
+)
+pool_timeouts = registry.counter(
+    'db_pool_timeouts_total',
+    'Checkouts that gave up waiting for a pooled connection'
+)
+reconnects = registry.counter(
+    'db_reconnects_total',
+    'Statements retried after the connection was dropped'
+)
+
+# Result of a write statement, its cursor is already closed
+QueryResult = namedtuple('QueryResult', ['lastrowid', 'rowcount'])
+
+# Errors that mean the server connection is gone
+_DISCONNECT_ERRORS = {
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.CR_SERVER_LOST,
+    errorcode.CR_CONNECTION_ERROR,
+    errorcode.CR_CONN_HOST_ERROR
+}
+
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+`?(\w+)', re.IGNORECASE)
+_statement_labels = {}
+
+def statement_label(query):
+    """Short 'OPERATION table' label for a query, cached per query string"""
+    label = _statement_labels.get(query)
+    if label is None:
+        words = query.split(None, 1)
+        operation = words[0].upper() if words else 'UNKNOWN'
+        match = _TABLE_PATTERN.search(query)
+        label = f"{operation} {match.group(1)}" if match else operation
+        _statement_labels[query] = label
+    return label
+
 class Database:
     def __init__(self):
         self.host = os.getenv('DB_HOST', 'localhost')
         self.user = os.getenv('DB_USER', 'root')
         self.password = os.getenv('DB_PASSWORD', 'root')
         self.database = os.getenv('DB_NAME', 'proctoring_db')
-        self.connection = None
+        
+        # mysql.connector caps a pool at 32 connections
+        self.pool_size = min(32, max(1, int(os.getenv('DB_POOL_SIZE', 10))))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', 5))
+        self.pool = None
+        
+        # get_connection() fails at once when the pool is empty, so callers
+        # queue on this semaphore for at most pool_timeout seconds instead
+        self._available = threading.BoundedSemaphore(self.pool_size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.pool_wait = LatencyWindow()
     
     def connect(self):
         try:
-            self.connection = mysql.connector.connect(
+            self.pool = pooling.MySQLConnectionPool(
+                pool_name='proctoring',
+                pool_size=self.pool_size,
+                # Every statement commits on its own, so a pooled connection
+                # never keeps an old REPEATABLE READ snapshot for later reads
+                autocommit=True,
+                # With autocommit and no session state set by the handlers,
+                # the reset round trip on checkout is not needed
+                pool_reset_session=False,
                 host=self.host,
                 user=self.user,
                 password=self.password,
                 database=self.database
             )
-            if self.connection.is_connected():
-                print("Successfully connected to MySQL database")
-                return self.connection
+            print(f"Successfully connected to MySQL database (pool of {self.pool_size})")
+            return self.pool
         except Error as e:
             print(f"Error connecting to MySQL: {e}")
             return None
     
     def disconnect(self):
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("MySQL connection closed")
+        if self.pool:
+            # Take every idle connection out of the pool and close it
+            closed = 0
+            for _ in range(self.pool_size):
+                try:
+                    conn = self.pool.get_connection()
+                except PoolError:
+                    # Empty, the rest is checked out
+                    break
+                except Error:
+                    # Dead connection that could not reconnect, nothing to close
+                    continue
+                conn.disconnect()
+                closed += 1
+            self.pool = None
+            print(f"MySQL connection pool closed ({closed} connections)")
     
-    def execute_query(self, query, params=None):
-        cursor = self.connection.cursor(dictionary=True)
+    @contextmanager
+    def connection(self):
+        """Check out a pooled connection for the duration of the block"""
+        if self.pool is None:
+            raise PoolError("Database is not connected")
+        
+        started = time.perf_counter()
+        if not self._available.acquire(timeout=self.pool_timeout):
+            pool_timeouts.inc()
+            raise PoolError(f"No database connection available within {self.pool_timeout}s")
+        waited = time.perf_counter() - started
+        pool_wait_seconds.observe(waited)
+        self.pool_wait.record(waited)
+        
+        try:
+            # The pool pings the connection and reconnects it if it went stale
+            conn = self.pool.get_connection()
+        except Exception:
+            self._available.release()
+            raise
+        
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            try:
+                conn.close()  # Returns the connection to the pool
+            except Error:
+                # A dead connection is reconnected by the pool on its next checkout
+                pass
+            self._available.release()
+    
+    def _run(self, query, params, handle, retry=True):
+        """
+        Run one statement on a pooled connection
+        With retry, a statement whose connection dropped is run once more.
+        Writes pass retry=False: the server may have committed the row
+        before the connection was lost, and a retry would write it twice.
+        """
+        with self.connection() as conn:
+            for attempt in range(2):
+                try:
+                    with closing(conn.cursor(dictionary=True, buffered=True)) as cursor:
+                        self._timed_execute(cursor, query, params)
+                        return handle(cursor)
+                except (OperationalError, InterfaceError) as e:
+                    if attempt or not retry or e.errno not in _DISCONNECT_ERRORS:
+                        raise
+                    reconnects.inc()
+                    conn.reconnect(attempts=2, delay=0.5)
+    
+    def _timed_execute(self, cursor, query, params):
+        label = statement_label(query)
+        started = time.perf_counter()
         try:
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
-            self.connection.commit()
-            return cursor
+        except Error:
+            query_errors.inc(statement=label)
+            raise
+        finally:
+            query_seconds.observe(time.perf_counter() - started, statement=label)
+    
+    def execute_query(self, query, params=None, raise_errors=False):
+        """Run a write statement, errors are logged and give None unless raise_errors is set"""
+        def result(cursor):
+            return QueryResult(cursor.lastrowid, cursor.rowcount)
+        
+        try:
+            # Committed by autocommit as soon as it has run
+            return self._run(query, params, result, retry=False)
         except Error as e:
+            if raise_errors:
+                raise
             print(f"Error executing query: {e}")
             return None
     
-    def fetch_all(self, query, params=None):
-        cursor = self.connection.cursor(dictionary=True)
+    def fetch_all(self, query, params=None, raise_errors=False):
         try:
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            return cursor.fetchall()
+            return self._run(query, params, lambda cursor: cursor.fetchall())
         except Error as e:
+            if raise_errors:
+                raise
             print(f"Error fetching data: {e}")
             return []
     
     def fetch_one(self, query, params=None):
-        cursor = self.connection.cursor(dictionary=True)
         try:
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            return cursor.fetchone()
+            return self._run(query, params, lambda cursor: cursor.fetchone())
         except Error as e:
             print(f"Error fetching data: {e}")
             return None
+    
+    def utilization(self):
+        return self.in_use / self.pool_size
+    
+    def stats(self):
+        return {
+            'pool_size': self.pool_size,
+            'in_use': self.in_use,
+            'utilization': round(self.utilization(), 3),
+            'wait': self.pool_wait.summary()
+        }
+
+class AsyncDatabase:
+    """
+    Awaitable wrapper with the same methods as Database
+    Statements run on a dedicated thread pool sized like the connection
+    pool, so a slow query waits there instead of stopping the event loop.
+    """
+    
+    def __init__(self, database):
+        self.database = database
+        self.max_workers = database.pool_size
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='db'
+        )
+        # Calls submitted to the executor and not finished yet
+        self.pending = 0
+    
+    async def _call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(self.executor, method, *args)
+        finally:
+            self.pending -= 1
+    
+    async def connect(self):
+        return await self._call(self.database.connect)
+    
+    async def disconnect(self):
+        await self._call(self.database.disconnect)
+        self.executor.shutdown(wait=True)
+    
+    async def execute_query(self, query, params=None, raise_errors=False):
+        return await self._call(self.database.execute_query, query, params, raise_errors)
+    
+    async def fetch_all(self, query, params=None, raise_errors=False):
+        return await self._call(self.database.fetch_all, query, params, raise_errors)
+    
+    async def fetch_one(self, query, params=None):
+        return await self._call(self.database.fetch_one, query, params)
+    
+    def stats(self):
+        stats = self.database.stats()
+        # Calls beyond the thread count are waiting for a thread
+        stats['queued'] = max(0, self.pending - self.max_workers)
+        return stats
 
-# Global database instance
+# Global database instances
 db = Database()
+async_db = AsyncDatabase(db)
+
+registry.gauge(
+    'db_pool_connections_in_use',
+    'Pooled database connections currently checked out',
+    function=lambda: db.in_use
+)
+registry.gauge(
+    'db_pool_utilization',
+    'Fraction of the database pool checked out',
+    function=db.utilization
+)
@@ -0,0 +1,116 @@
+"""
+Cross-session micro-batching for object detection
+Frames from concurrent exams are collected until either the maximum batch
+size or the latency deadline of the oldest frame is reached, then run as a
+single batched inference. Each waiting request gets its own result back.
+"""
+
+import asyncio
+import os
+import time
+
+from timing import LatencyWindow
+
+
+class DetectionBatcher:
+    def __init__(self, run_batch, max_batch_size=None, max_wait_ms=None):
+        """
+        run_batch: coroutine function taking a list of items and returning
+        one result per item, in the same order
+        """
+        if max_batch_size is None:
+            max_batch_size = int(os.getenv('DETECTION_BATCH_SIZE', 8))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv('DETECTION_BATCH_WAIT_MS', 20))
+
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = None
+        self._task = None
+        self._inflight = set()
+
+        # Metrics
+        self.batches = 0
+        self.frames = 0
+        self.batch_sizes = {}
+        self.queue_wait = LatencyWindow()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def enqueue(self, item):
+        """Queue an item for the next batch and return a future for its result"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        return future
+
+    async def _collect(self):
+        while True:
+            first = await self._queue.get()
+            batch = [first]
+            deadline = first[2] + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Keep collecting the next batch while this one runs
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            self.queue_wait.record(started - enqueued)
+
+        size = len(batch)
+        self.batches += 1
+        self.frames += size
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+
+        try:
+            results = await self.run_batch([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': self.batches,
+            'frames': self.frames,
+            'average_batch_size': round(self.frames / self.batches, 2) if self.batches else 0,
+            'batch_sizes': self.batch_sizes,
+            'queue_depth': self.queue_depth(),
+            'queue_wait': self.queue_wait.summary()
+        }
@@ -0,0 +1,57 @@
+"""
+Violation episodes
+An episode is a run of consecutive frames showing the same violation type,
+with its start and end time, peak severity and frame count. Shared by the
+live debouncer and the offline re-analysis CLI, so this module must not
+import the database or any model code.
+"""
+
+SEVERITY_RANK = {'low': 1, 'medium': 2, 'high': 3}
+
+
+class Episode:
+    def __init__(self, violation_type, severity, message, now):
+        self.id = None
+        self.violation_type = violation_type
+        self.severity = severity
+        self.message = message
+        self.started_at = now
+        self.last_seen = now
+        self.frame_count = 1
+
+    def extend(self, severity, now):
+        if SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(self.severity, 0):
+            self.severity = severity
+        self.last_seen = now
+        self.frame_count += 1
+
+
+def merge_frames(frames):
+    """
+    Merge (time, violations) pairs, ordered by time, into episodes
+    An episode closes on the first frame without its violation type
+    Returns the closed episodes ordered by start time
+    """
+    closed = []
+    open_episodes = {}
+
+    for now, violations in frames:
+        seen = set()
+        for violation in violations:
+            violation_type = violation['type']
+            seen.add(violation_type)
+            episode = open_episodes.get(violation_type)
+            if episode:
+                episode.extend(violation['severity'], now)
+            else:
+                open_episodes[violation_type] = Episode(
+                    violation_type, violation['severity'], violation['message'], now
+                )
+
+        for violation_type in list(open_episodes):
+            if violation_type not in seen:
+                closed.append(open_episodes.pop(violation_type))
+
+    closed.extend(open_episodes.values())
+    closed.sort(key=lambda episode: episode.started_at)
+    return closed
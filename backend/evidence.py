@@ -0,0 +1,274 @@
+"""
+Evidence snapshots for violations
+Each exam keeps its last few uploaded JPEG frames in an in-memory ring.
+When a violation episode opens, the ring is handed to a background thread
+that writes the frames to a content-addressed store on disk (one file per
+SHA-256 digest, so frames shared by overlapping episodes are stored once)
+plus a small manifest named by the evidence id saved on the violations row.
+The analyze request only appends to the ring and enqueues a snapshot, all
+hashing and file I/O happens on the writer thread. The store is bounded by
+a size quota covering frames and manifests. The oldest manifests are evicted
+first, and a frame is deleted once no remaining manifest references it, so
+a stored manifest never points at a missing frame.
+"""
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from hashlib import sha256
+
+from metrics import registry
+
+# Ids and digests are hex, anything else is rejected before touching the disk
+_HEX_PATTERN = re.compile(r'^[0-9a-f]{16,64}$')
+
+evidence_frames = registry.counter(
+    'proctoring_evidence_frames_total',
+    'Evidence frames handled by the writer',
+    ['outcome']
+)
+
+
+class EvidenceStore:
+    def __init__(self, root=None, ring_frames=None, max_mb=None, max_sessions=None, max_queue=None):
+        if root is None:
+            root = os.getenv('EVIDENCE_DIR', '../evidence')
+        if ring_frames is None:
+            ring_frames = int(os.getenv('EVIDENCE_RING_FRAMES', 5))
+        if max_mb is None:
+            max_mb = float(os.getenv('EVIDENCE_MAX_MB', 1024))
+        if max_sessions is None:
+            max_sessions = int(os.getenv('EVIDENCE_MAX_SESSIONS', 5000))
+        if max_queue is None:
+            max_queue = int(os.getenv('EVIDENCE_QUEUE_MAX', 1000))
+
+        self.root = root
+        self.frames_dir = os.path.join(root, 'frames')
+        self.manifests_dir = os.path.join(root, 'manifests')
+        self.ring_frames = ring_frames
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_sessions = max_sessions
+
+        # exam_id -> deque of (captured_at, jpeg bytes), least recent exam first
+        self.rings = OrderedDict()
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+
+        # Owned by the writer thread: digest -> size in bytes, digest ->
+        # number of manifests referencing it, and evidence_id ->
+        # (manifest size in bytes, digests) with the oldest manifest first
+        self._index = {}
+        self._refs = {}
+        self._manifests = OrderedDict()
+        self.stored_bytes = 0
+
+        # Metrics
+        self.snapshots = 0
+        self.dropped = 0
+        self.frames_written = 0
+        self.frames_deduplicated = 0
+        self.frames_evicted = 0
+        self.manifests_evicted = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='evidence-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write the queued snapshots and stop the writer thread"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def record(self, exam_id, data):
+        """Keep an uploaded frame in the exam's ring (request path, no I/O)"""
+        ring = self.rings.get(exam_id)
+        if ring is None:
+            ring = deque(maxlen=self.ring_frames)
+            self.rings[exam_id] = ring
+            while len(self.rings) > self.max_sessions:
+                self.rings.popitem(last=False)
+        else:
+            self.rings.move_to_end(exam_id)
+        # Upload buffers are reused by the decoder, keep a private copy
+        ring.append((time.time(), bytes(data)))
+
+    def capture(self, exam_id, violation_type):
+        """
+        Snapshot the exam's ring for a new violation
+        Returns the evidence id to store on the violations row, or None
+        """
+        ring = self.rings.get(exam_id)
+        if not ring or self._thread is None:
+            return None
+
+        evidence_id = uuid.uuid4().hex
+        try:
+            self._queue.put_nowait((evidence_id, exam_id, violation_type, list(ring)))
+        except queue.Full:
+            self.dropped += 1
+            evidence_frames.inc(len(ring), outcome='dropped')
+            return None
+        self.snapshots += 1
+        return evidence_id
+
+    def release(self, exam_id):
+        self.rings.pop(exam_id, None)
+
+    def frame_path(self, digest):
+        if not _HEX_PATTERN.match(digest):
+            return None
+        return os.path.join(self.frames_dir, digest[:2], digest + '.jpg')
+
+    def manifest_path(self, evidence_id):
+        if not _HEX_PATTERN.match(evidence_id):
+            return None
+        return os.path.join(self.manifests_dir, evidence_id + '.json')
+
+    def load_manifest(self, evidence_id):
+        path = self.manifest_path(evidence_id)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _run(self):
+        os.makedirs(self.frames_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        self._load_index()
+
+        while True:
+            snapshot = self._queue.get()
+            if snapshot is None:
+                break
+            try:
+                self._write(*snapshot)
+            except OSError as e:
+                print(f"❌ Evidence write failed: {e}")
+
+    def _load_index(self):
+        """Rebuild frame reference counts from the stored manifests, oldest first"""
+        for prefix in os.scandir(self.frames_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                size = entry.stat().st_size
+                self._index[entry.name[:-4]] = size
+                self.stored_bytes += size
+
+        manifests = []
+        for entry in os.scandir(self.manifests_dir):
+            stat = entry.stat()
+            manifests.append((stat.st_mtime, entry.name[:-5], stat.st_size, entry.path))
+
+        for _, evidence_id, size, path in sorted(manifests):
+            try:
+                with open(path) as f:
+                    digests = {frame['sha256'] for frame in json.load(f)['frames']}
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Skipping unreadable evidence manifest {evidence_id}: {e}")
+                continue
+            if not digests.issubset(self._index):
+                # Frames already gone, the manifest would only give 404s
+                self._remove(path)
+                continue
+            self._add_manifest(evidence_id, size, digests)
+
+        # Frames no manifest points at can never be served
+        for digest in [digest for digest in self._index if digest not in self._refs]:
+            self._remove_frame(digest)
+        self._enforce_quota()
+
+    def _write(self, evidence_id, exam_id, violation_type, frames):
+        manifest_frames = []
+        for captured_at, data in frames:
+            digest = sha256(data).hexdigest()
+            if digest in self._index:
+                self.frames_deduplicated += 1
+                evidence_frames.inc(outcome='deduplicated')
+            else:
+                path = self.frame_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self._index[digest] = len(data)
+                self.stored_bytes += len(data)
+                self.frames_written += 1
+                evidence_frames.inc(outcome='written')
+
+            manifest_frames.append({
+                'sha256': digest,
+                'captured_at': datetime.fromtimestamp(captured_at).isoformat(timespec='milliseconds'),
+                'bytes': len(data)
+            })
+
+        manifest = json.dumps({
+            'evidence_id': evidence_id,
+            'exam_id': exam_id,
+            'violation_type': violation_type,
+            'frames': manifest_frames
+        })
+        with open(self.manifest_path(evidence_id), 'w') as f:
+            f.write(manifest)
+        self._add_manifest(evidence_id, len(manifest), {frame['sha256'] for frame in manifest_frames})
+
+        self._enforce_quota()
+
+    def _add_manifest(self, evidence_id, size, digests):
+        self._manifests[evidence_id] = (size, digests)
+        self.stored_bytes += size
+        for digest in digests:
+            self._refs[digest] = self._refs.get(digest, 0) + 1
+
+    def _enforce_quota(self):
+        while self.stored_bytes > self.max_bytes and self._manifests:
+            evidence_id, (size, digests) = self._manifests.popitem(last=False)
+            self._remove(self.manifest_path(evidence_id))
+            self.stored_bytes -= size
+            self.manifests_evicted += 1
+
+            for digest in digests:
+                self._refs[digest] -= 1
+                if not self._refs[digest]:
+                    self._remove_frame(digest)
+                    self.frames_evicted += 1
+                    evidence_frames.inc(outcome='evicted')
+
+    def _remove_frame(self, digest):
+        self._refs.pop(digest, None)
+        self.stored_bytes -= self._index.pop(digest)
+        self._remove(self.frame_path(digest))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        return {
+            'sessions': len(self.rings),
+            'ring_frames': self.ring_frames,
+            'snapshots': self.snapshots,
+            'queued': self._queue.qsize(),
+            'dropped': self.dropped,
+            'frames_written': self.frames_written,
+            'frames_deduplicated': self.frames_deduplicated,
+            'frames_evicted': self.frames_evicted,
+            'manifests_evicted': self.manifests_evicted,
+            'stored_mb': round(self.stored_bytes / (1024 * 1024), 2),
+            'max_mb': round(self.max_bytes / (1024 * 1024), 2)
+        }
+
+
+# Global evidence store instance
+evidence = EvidenceStore()
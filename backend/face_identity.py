@@ -0,0 +1,275 @@
+"""
+Face Identity Verification Module
+Checks that the student who started an exam is the one still sitting it.
+The first frames of an exam with exactly one face are embedded with a CPU
+face recognition model (ArcFace/MobileFaceNet style ONNX, 112x112 input)
+and averaged into a reference embedding, once per exam. Afterwards every
+IDENTITY_VERIFY_EVERY-th frame embeds the faces already found by the face
+detector and compares them to the reference with one matrix-vector product.
+Verification is disabled when onnxruntime or the model file is missing.
+Partial enrollments of exams that sent no frame for IDENTITY_IDLE_SECONDS
+are dropped. The reference itself (a few KB) is kept until the exam is
+finished, so a returning student is verified instead of silently enrolled
+again.
+"""
+
+import os
+import time
+
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+DEFAULT_MODEL_PATH = '../models/face_embedding.onnx'
+
+# Where eyes, nose tip and mouth center sit in a 112x112 aligned face
+ALIGNED_SIZE = 112
+ALIGNED_POINTS = np.array([
+    [38.29, 51.70],
+    [73.53, 51.50],
+    [56.03, 71.74],
+    [56.14, 92.28]
+], dtype=np.float32)
+
+
+def align_face(rgb_frame, detection):
+    """
+    Warp a detected face onto the aligned 112x112 template
+    Uses the right eye, left eye, nose tip and mouth center keypoints of a
+    MediaPipe face detection
+    """
+    height, width = rgb_frame.shape[:2]
+    keypoints = detection.location_data.relative_keypoints
+    points = np.array([[keypoints[i].x * width, keypoints[i].y * height] for i in range(4)],
+                      dtype=np.float32)
+
+    matrix, _ = cv2.estimateAffinePartial2D(points, ALIGNED_POINTS)
+    if matrix is None:
+        return None
+    return cv2.warpAffine(rgb_frame, matrix, (ALIGNED_SIZE, ALIGNED_SIZE), borderValue=0)
+
+
+class FaceEmbedder:
+    """Face recognition model on the ONNX Runtime CPU provider"""
+
+    def __init__(self, model_path, threads=1):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Some exports take NHWC input instead of NCHW
+        self.channels_last = model_input.shape[-1] == 3
+        print(f"Initialized face embedding model: {model_path}")
+
+    def embed(self, faces):
+        """L2-normalized float32 embeddings of aligned RGB faces, one row per face"""
+        tensor = (np.stack(faces).astype(np.float32) - 127.5) / 127.5
+        if not self.channels_last:
+            tensor = tensor.transpose(0, 3, 1, 2)
+
+        embeddings = self.session.run(None, {self.input_name: np.ascontiguousarray(tensor)})[0]
+        embeddings = embeddings.reshape(len(faces), -1).astype(np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-6)
+
+
+class EmbeddingStore:
+    """Reference embeddings of all exams in one float32 matrix"""
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.matrix = None
+        # exam_id -> row in matrix
+        self.rows = {}
+        self._free_rows = []
+
+    def __contains__(self, exam_id):
+        return exam_id in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def put(self, exam_id, embedding):
+        if self.matrix is None:
+            self.matrix = np.zeros((self.capacity, len(embedding)), dtype=np.float32)
+
+        row = self.rows.get(exam_id)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+            else:
+                row = len(self.rows)
+                if row >= len(self.matrix):
+                    # Grow by doubling, rows keep their positions
+                    self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+            self.rows[exam_id] = row
+        self.matrix[row] = embedding
+
+    def similarity(self, exam_id, embeddings):
+        """Cosine similarity of normalized embeddings to the exam's reference"""
+        return embeddings @ self.matrix[self.rows[exam_id]]
+
+    def release(self, exam_id):
+        row = self.rows.pop(exam_id, None)
+        if row is not None:
+            self.matrix[row] = 0
+            self._free_rows.append(row)
+
+    def nbytes(self):
+        return self.matrix.nbytes if self.matrix is not None else 0
+
+
+class FaceIdentity:
+    def __init__(self):
+        """
+        Initialize identity verification
+        IDENTITY_BACKEND is 'onnx' or 'off'; 'auto' enables verification
+        whenever onnxruntime and the model file are available
+        """
+        backend = os.getenv('IDENTITY_BACKEND', 'auto').lower()
+        model_path = os.getenv('FACE_EMBEDDING_MODEL', DEFAULT_MODEL_PATH)
+
+        # Cosine similarity below which a face is not the enrolled student
+        self.threshold = float(os.getenv('IDENTITY_THRESHOLD', 0.35))
+        self.verify_every = max(1, int(os.getenv('IDENTITY_VERIFY_EVERY', 10)))
+        self.enroll_frames = max(1, int(os.getenv('IDENTITY_ENROLL_FRAMES', 3)))
+        # An exam idle this long re-enrolls when it comes back
+        self.idle_timeout = float(os.getenv('IDENTITY_IDLE_SECONDS', 1800))
+        # Faces embedded per verification at most
+        self.max_faces = 4
+
+        onnx_available = ort is not None and os.path.exists(model_path)
+        if backend == 'onnx' and not onnx_available:
+            print(f"⚠️ Identity verification requested but unavailable ({model_path}), disabled")
+
+        self.embedder = None
+        if backend != 'off' and onnx_available:
+            self.embedder = FaceEmbedder(
+                model_path,
+                threads=int(os.getenv('FACE_EMBEDDING_THREADS', 1))
+            )
+
+        self.store = EmbeddingStore()
+        # exam_id -> embeddings collected while enrolling
+        self._enrolling = {}
+        # exam_id -> frames seen since enrollment
+        self._frames = {}
+        # exam_id -> monotonic time of its last checked frame
+        self._last_seen = {}
+        self._last_sweep = 0.0
+
+        self.counters = {
+            'enrolled': 0,
+            'verifications': 0,
+            'mismatches': 0,
+            'expired': 0
+        }
+
+    @property
+    def enabled(self):
+        return self.embedder is not None
+
+    def check(self, exam_id, rgb_frame, detections):
+        """
+        Enroll or re-verify the student of an exam on one frame
+        Returns None when nothing was checked on this frame, else a dict
+        with the status ('enrolling', 'enrolled', 'verified', 'mismatch')
+        """
+        if not self.enabled or exam_id is None:
+            return None
+
+        now = time.monotonic()
+        self._last_seen[exam_id] = now
+        self._sweep_idle(now)
+        if not detections:
+            return None
+
+        if exam_id not in self.store:
+            return self._enroll(exam_id, rgb_frame, detections)
+
+        frames = self._frames.get(exam_id, 0) + 1
+        self._frames[exam_id] = frames
+        if frames % self.verify_every:
+            return None
+
+        faces = [align_face(rgb_frame, detection) for detection in detections[:self.max_faces]]
+        faces = [face for face in faces if face is not None]
+        if not faces:
+            return None
+
+        similarity = float(self.store.similarity(exam_id, self.embedder.embed(faces)).max())
+        self.counters['verifications'] += 1
+        verified = similarity >= self.threshold
+        if not verified:
+            self.counters['mismatches'] += 1
+        return {
+            'status': 'verified' if verified else 'mismatch',
+            'similarity': round(similarity, 3)
+        }
+
+    def _enroll(self, exam_id, rgb_frame, detections):
+        # Only a frame with exactly one face shows who the student is
+        if len(detections) != 1:
+            return None
+        face = align_face(rgb_frame, detections[0])
+        if face is None:
+            return None
+
+        samples = self._enrolling.setdefault(exam_id, [])
+        samples.append(self.embedder.embed([face])[0])
+        if len(samples) < self.enroll_frames:
+            return {'status': 'enrolling'}
+
+        reference = np.mean(samples, axis=0)
+        self.store.put(exam_id, reference / max(np.linalg.norm(reference), 1e-6))
+        del self._enrolling[exam_id]
+        self.counters['enrolled'] += 1
+        return {'status': 'enrolled'}
+
+    def get_violation_summary(self, identity):
+        """Generate summary of an identity check"""
+        if identity and identity['status'] == 'mismatch':
+            return {
+                'type': 'identity_mismatch',
+                'severity': 'high',
+                'message': f"Face does not match the enrolled student (similarity {identity['similarity']})"
+            }
+        return None
+
+    def _sweep_idle(self, now):
+        # Walks every exam, so at most once a minute
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        idle = [exam_id for exam_id, last_seen in self._last_seen.items()
+                if now - last_seen > self.idle_timeout]
+        for exam_id in idle:
+            self._enrolling.pop(exam_id, None)
+            self._last_seen.pop(exam_id, None)
+            self.counters['expired'] += 1
+
+    def release(self, exam_id):
+        self.store.release(exam_id)
+        self._enrolling.pop(exam_id, None)
+        self._frames.pop(exam_id, None)
+        self._last_seen.pop(exam_id, None)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'exams': len(self.store),
+            'store_bytes': self.store.nbytes(),
+            **self.counters
+        }
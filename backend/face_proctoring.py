@@ -1,8 +1,12 @@
 import cv2
 import mediapipe as mp
 import numpy as np
+import os
+import time
 from datetime import datetime
 
+from head_pose import estimate_head_pose, eye_gaze_angles, gaze_scores, iris_offsets, landmarks_to_array
+
 class FaceProctoring:
     def __init__(self):
         self.mp_face_detection = mp.solutions.face_detection
@@ -11,17 +15,68 @@ class FaceProctoring:
             model_selection=1, 
             min_detection_confidence=0.5
         )
+        # The mesh only ever sees the single face cropped out by the detector
         self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=5,
-            refine_landmarks=True,
+            max_num_faces=1,
+            refine_landmarks=False,
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
+        # Iris-refined mesh, created on first borderline gaze reading
+        self.face_mesh_refined = None
+        
+        # Head turned beyond either limit (degrees) counts as looking away
+        self.yaw_limit = float(os.getenv('HEAD_YAW_LIMIT', 25))
+        self.pitch_limit = float(os.getenv('HEAD_PITCH_LIMIT', 20))
+        
+        # Cascade settings, the borderline band is a fraction of the limits
+        self.gaze_borderline_margin = float(os.getenv('GAZE_BORDERLINE_MARGIN', 0.2))
+        self.mesh_interval = max(1, int(os.getenv('FACE_MESH_INTERVAL', 3)))
+        self.crop_margin = float(os.getenv('FACE_CROP_MARGIN', 0.25))
+        # Crop is re-centered once the face fills less than this share of it
+        self.crop_min_fill = 0.2
+        
+        # Cascade state: the mesh is skipped while gaze stays stable
+        self._gaze_stable = False
+        self._frames_since_mesh = 0
+        self._last_pose = None
+        # Mesh crop in relative frame coordinates (x0, y0, x1, y1), kept
+        # fixed across frames so the tracking FaceMesh sees a stable image
+        self._crop_box = None
+        
+        # Stage-skip counters
+        self.stage_counters = {
+            'frames': 0,
+            'detection_runs': 0,
+            'mesh_runs': 0,
+            'refined_mesh_runs': 0,
+            'mesh_skipped_stable': 0,
+            'mesh_skipped_multiple_faces': 0,
+            'crop_updates': 0
+        }
+        
+        # Stage durations of the last analyzed frame, in seconds
+        self.timings = {}
+        
+        # Face detections of the last analyzed frame, reused by identity checks
+        self.last_detections = None
+        
         self.violations = []
+        self._closed = False
     
     def analyze_frame(self, frame):
         """
-        Analyze a single frame for proctoring violations
+        Analyze a single BGR frame for proctoring violations
+        Returns: dict with violation details
+        """
+        # Convert BGR to RGB
+        return self.analyze_rgb(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    
+    def analyze_rgb(self, rgb_frame):
+        """
+        Analyze a single RGB frame for proctoring violations
+        Runs the cheap face detector on every frame and the face mesh only
+        when a single face is present and its gaze is not known to be stable
         Returns: dict with violation details
         """
         violations = {
@@ -29,14 +84,18 @@ class FaceProctoring:
             'no_face': False,
             'looking_away': False,
             'face_count': 0,
+            'head_pose': None,
             'timestamp': datetime.now().isoformat()
         }
-        
-        # Convert BGR to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        self.stage_counters['frames'] += 1
+        self.timings = {}
         
         # Detect faces
+        started = time.perf_counter()
         results = self.face_detection.process(rgb_frame)
+        self.timings['face_detection'] = time.perf_counter() - started
+        self.stage_counters['detection_runs'] += 1
+        self.last_detections = results.detections
         
         if results.detections:
             face_count = len(results.detections)
@@ -47,31 +106,151 @@ class FaceProctoring:
                 violations['multiple_faces'] = True
                 violations['severity'] = 'high'
                 violations['description'] = f'{face_count} faces detected'
+                
+                # Multiple faces already outranks looking away
+                self._gaze_stable = False
+                self.stage_counters['mesh_skipped_multiple_faces'] += 1
+                return violations
+            
+            if self._gaze_stable and self._frames_since_mesh < self.mesh_interval - 1:
+                # Gaze was clearly on screen recently, reuse that verdict
+                self._frames_since_mesh += 1
+                self.stage_counters['mesh_skipped_stable'] += 1
+                violations['head_pose'] = self._last_pose
+                return violations
             
-            # Analyze face mesh for gaze direction
-            mesh_results = self.face_mesh.process(rgb_frame)
-            if mesh_results.multi_face_landmarks:
-                for face_landmarks in mesh_results.multi_face_landmarks:
-                    # Simple gaze detection based on eye landmarks
-                    left_eye = face_landmarks.landmark[33]  # Left eye
-                    right_eye = face_landmarks.landmark[263]  # Right eye
-                    nose = face_landmarks.landmark[1]  # Nose tip
-                    
-                    # Calculate if looking away (simplified)
-                    eye_center_x = (left_eye.x + right_eye.x) / 2
-                    deviation = abs(eye_center_x - nose.x)
-                    
-                    if deviation > 0.05:  # Threshold for looking away
-                        violations['looking_away'] = True
-                        violations['severity'] = 'medium'
-                        violations['description'] = 'Student looking away from screen'
+            started = time.perf_counter()
+            pose = self._head_pose(rgb_frame, results.detections[0])
+            self.timings['mesh'] = time.perf_counter() - started
+            self._frames_since_mesh = 0
+            
+            if pose is None:
+                self._gaze_stable = False
+                self._last_pose = None
+            else:
+                angles, score = pose
+                self._last_pose = {
+                    'yaw': round(float(angles[0]), 1),
+                    'pitch': round(float(angles[1]), 1),
+                    'roll': round(float(angles[2]), 1)
+                }
+                violations['head_pose'] = self._last_pose
+                
+                # Stable only when clearly inside the limits
+                self._gaze_stable = score < 1 - self.gaze_borderline_margin
+                
+                if score > 1:  # Head turned beyond the yaw or pitch limit
+                    violations['looking_away'] = True
+                    violations['severity'] = 'medium'
+                    violations['description'] = 'Student looking away from screen'
         else:
+            self._gaze_stable = False
             violations['no_face'] = True
             violations['severity'] = 'high'
             violations['description'] = 'No face detected'
         
         return violations
     
+    def reset_state(self):
+        """
+        Forget the cascade state of the previous frames
+        Used when consecutive frames may come from different students, so
+        one student's stable gaze or crop never carries over to another
+        """
+        self._gaze_stable = False
+        self._frames_since_mesh = 0
+        self._last_pose = None
+        self._crop_box = None
+    
+    def _crop_to_face(self, rgb_frame, detection):
+        """
+        Crop the frame around the detected face
+        The crop (the detector's box plus a margin) is only moved when the
+        face leaves it or shrinks well inside it. In between, FaceMesh gets
+        the same region on every run and can track landmarks from its last
+        result instead of re-detecting.
+        """
+        height, width = rgb_frame.shape[:2]
+        box = detection.location_data.relative_bounding_box
+        # Detector boxes may reach past the frame edges
+        face = (
+            max(0.0, box.xmin),
+            max(0.0, box.ymin),
+            min(1.0, box.xmin + box.width),
+            min(1.0, box.ymin + box.height)
+        )
+        
+        crop = self._crop_box
+        if crop is None or not self._crop_fits(crop, face):
+            margin_x = box.width * self.crop_margin
+            margin_y = box.height * self.crop_margin
+            crop = (
+                max(0.0, face[0] - margin_x),
+                max(0.0, face[1] - margin_y),
+                min(1.0, face[2] + margin_x),
+                min(1.0, face[3] + margin_y)
+            )
+            self._crop_box = crop
+            self.stage_counters['crop_updates'] += 1
+        
+        x0 = int(crop[0] * width)
+        y0 = int(crop[1] * height)
+        x1 = int(crop[2] * width)
+        y1 = int(crop[3] * height)
+        
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return rgb_frame, 0, 0
+        return np.ascontiguousarray(rgb_frame[y0:y1, x0:x1]), x0, y0
+    
+    def _crop_fits(self, crop, face):
+        """Whether the face lies inside the crop and still fills enough of it"""
+        inside = (face[0] >= crop[0] and face[1] >= crop[1]
+                  and face[2] <= crop[2] and face[3] <= crop[3])
+        crop_area = (crop[2] - crop[0]) * (crop[3] - crop[1])
+        face_area = (face[2] - face[0]) * (face[3] - face[1])
+        return inside and crop_area > 0 and face_area / crop_area >= self.crop_min_fill
+    
+    def _head_pose(self, rgb_frame, detection):
+        """
+        Yaw/pitch/roll of the detected face and its gaze score. The
+        iris-refined mesh is only run when the plain mesh reading falls
+        inside the borderline band around the limits, its score also
+        counts where the eyes look.
+        """
+        crop, _, _ = self._crop_to_face(rgb_frame, detection)
+        
+        pose = self._mesh_pose(self.face_mesh, crop)
+        self.stage_counters['mesh_runs'] += 1
+        
+        if pose is not None and abs(pose[1] - 1) <= self.gaze_borderline_margin:
+            if self.face_mesh_refined is None:
+                self.face_mesh_refined = self.mp_face_mesh.FaceMesh(
+                    max_num_faces=1,
+                    refine_landmarks=True,
+                    min_detection_confidence=0.5,
+                    min_tracking_confidence=0.5
+                )
+            refined = self._mesh_pose(self.face_mesh_refined, crop, iris=True)
+            self.stage_counters['refined_mesh_runs'] += 1
+            if refined is not None:
+                pose = refined
+        
+        return pose
+    
+    def _mesh_pose(self, face_mesh, crop, iris=False):
+        mesh_results = face_mesh.process(crop)
+        if not mesh_results.multi_face_landmarks:
+            return None
+        
+        # Rotation does not depend on where the crop sits in the frame
+        landmarks = landmarks_to_array(mesh_results.multi_face_landmarks)
+        angles = estimate_head_pose(landmarks, crop.shape[1], crop.shape[0])
+        gaze = angles
+        if iris:
+            gaze = eye_gaze_angles(angles, iris_offsets(mesh_results.multi_face_landmarks))
+        scores = gaze_scores(gaze, self.yaw_limit, self.pitch_limit)
+        return angles[0], float(scores[0])
+    
     def get_violation_summary(self, violations):
         """Generate summary of violations"""
         if violations['multiple_faces']:
@@ -94,8 +273,15 @@ class FaceProctoring:
             }
         return None
     
+    def close(self):
+        """Release the MediaPipe graphs held by this instance"""
+        if getattr(self, '_closed', True):
+            return
+        self._closed = True
+        self.face_detection.close()
+        self.face_mesh.close()
+        if self.face_mesh_refined is not None:
+            self.face_mesh_refined.close()
+    
     def __del__(self):
-        if hasattr(self, 'face_detection'):
-            self.face_detection.close()
-        if hasattr(self, 'face_mesh'):
-            self.face_mesh.close()
+        self.close()
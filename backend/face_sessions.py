@@ -0,0 +1,130 @@
+"""
+Per-exam FaceProctoring registry
+FaceMesh tracks landmarks across frames, which only helps when consecutive
+frames come from the same student. This registry gives every exam its own
+FaceProctoring instance so each stream stays in cheap tracking mode, and
+evicts idle sessions to keep memory bounded.
+
+A session that received a frame within FACE_SESSION_ACTIVE_SECONDS is never
+evicted to make room for another one, building a new graph pair costs more
+than the tracking saves. When the memory budget is full of active sessions,
+get() returns None and the caller analyzes the frame with its shared tracker.
+"""
+
+import os
+import time
+from collections import OrderedDict
+
+from face_proctoring import FaceProctoring
+
+# Rough resident size of one FaceDetection + FaceMesh graph pair
+SESSION_MEMORY_ESTIMATE_MB = 32
+# Extra size once the lazily created iris-refined FaceMesh exists
+REFINED_MESH_MEMORY_ESTIMATE_MB = 16
+
+
+def session_memory_mb(face_proctoring):
+    """Estimated resident size of one tracker"""
+    if face_proctoring.face_mesh_refined is not None:
+        return SESSION_MEMORY_ESTIMATE_MB + REFINED_MESH_MEMORY_ESTIMATE_MB
+    return SESSION_MEMORY_ESTIMATE_MB
+
+
+class FaceSessionRegistry:
+    def __init__(self, memory_budget_mb=None, idle_timeout=None, active_window=None):
+        if memory_budget_mb is None:
+            memory_budget_mb = int(os.getenv('FACE_SESSION_MEMORY_MB', 512))
+        if idle_timeout is None:
+            idle_timeout = float(os.getenv('FACE_SESSION_IDLE_SECONDS', 300))
+        if active_window is None:
+            active_window = float(os.getenv('FACE_SESSION_ACTIVE_SECONDS', 30))
+
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_timeout = idle_timeout
+        self.active_window = active_window
+
+        # exam_id -> [FaceProctoring, last_used], oldest first
+        self.sessions = OrderedDict()
+        self.evictions = 0
+        # Frames served by the shared tracker because the budget was full
+        self.overflow_frames = 0
+        # Stage counters of trackers that have already been closed
+        self.retired_counters = {}
+
+    def get(self, exam_id):
+        """
+        Return the tracker owned by an exam, creating it on first use
+        Returns None when there is no room without evicting an active session
+        """
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        entry = self.sessions.get(exam_id)
+        if entry is None:
+            if not self._make_room(now):
+                self.overflow_frames += 1
+                return None
+            entry = [FaceProctoring(), now]
+            self.sessions[exam_id] = entry
+        else:
+            entry[1] = now
+            self.sessions.move_to_end(exam_id)
+
+        return entry[0]
+
+    def release(self, exam_id):
+        """Drop an exam's tracker, e.g. once the exam has finished"""
+        entry = self.sessions.pop(exam_id, None)
+        if entry:
+            self._retire(entry[0])
+
+    def _evict_idle(self, now):
+        while self.sessions:
+            entry = next(iter(self.sessions.values()))
+            if now - entry[1] < self.idle_timeout:
+                break
+            self._evict_oldest()
+
+    def _make_room(self, now):
+        """Evict inactive sessions, oldest first, until a new one fits the budget"""
+        while self.sessions and self.memory_mb() + SESSION_MEMORY_ESTIMATE_MB > self.memory_budget_mb:
+            entry = next(iter(self.sessions.values()))
+            if now - entry[1] < self.active_window:
+                return False
+            self._evict_oldest()
+        return True
+
+    def _evict_oldest(self):
+        _, entry = self.sessions.popitem(last=False)
+        self._retire(entry[0])
+        self.evictions += 1
+
+    def _retire(self, face_proctoring):
+        for name, value in face_proctoring.stage_counters.items():
+            self.retired_counters[name] = self.retired_counters.get(name, 0) + value
+        face_proctoring.close()
+
+    def stage_counters(self):
+        """Stage-skip counters summed over live and retired trackers"""
+        totals = dict(self.retired_counters)
+        for face_proctoring, _ in self.sessions.values():
+            for name, value in face_proctoring.stage_counters.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def memory_mb(self):
+        return sum(session_memory_mb(entry[0]) for entry in self.sessions.values())
+
+    def stats(self):
+        return {
+            'active_sessions': len(self.sessions),
+            'memory_mb': self.memory_mb(),
+            'memory_budget_mb': self.memory_budget_mb,
+            'evictions': self.evictions,
+            'overflow_frames': self.overflow_frames
+        }
+
+    def close(self):
+        while self.sessions:
+            _, entry = self.sessions.popitem(last=False)
+            self._retire(entry[0])
@@ -0,0 +1,85 @@
+"""
+Per-exam frame change detection
+A student sitting still uploads nearly identical frames. Each exam keeps a
+tiny grayscale thumbnail of the last frame that was actually analyzed, and
+frames that barely differ from it reuse that analysis result instead of
+running face and object detection again.
+"""
+
+import os
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Thumbnail size used for the comparison (width, height)
+THUMBNAIL_SIZE = (32, 24)
+
+
+class FrameChangeDetector:
+    def __init__(self, threshold=None, max_reuse=None, max_sessions=None):
+        if threshold is None:
+            threshold = float(os.getenv('FRAME_CHANGE_THRESHOLD', 3.0))
+        if max_reuse is None:
+            max_reuse = int(os.getenv('FRAME_CACHE_MAX_REUSE', 5))
+        if max_sessions is None:
+            max_sessions = int(os.getenv('FRAME_CACHE_MAX_SESSIONS', 5000))
+
+        # Mean absolute gray-level difference below which frames match
+        self.threshold = threshold
+        # Force a fresh analysis after this many reused results in a row
+        self.max_reuse = max_reuse
+        self.max_sessions = max_sessions
+
+        # exam_id -> [thumbnail, result, reuse_count], least recent first
+        self.sessions = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+
+    def signature(self, frame):
+        """Downscaled grayscale thumbnail of a BGR frame"""
+        small = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def lookup(self, exam_id, signature):
+        """Return the previous result if the scene has not changed, else None"""
+        self.lookups += 1
+        entry = self.sessions.get(exam_id)
+        if entry is None:
+            return None
+        self.sessions.move_to_end(exam_id)
+
+        thumbnail, result, reuse_count = entry
+        if reuse_count >= self.max_reuse:
+            return None
+
+        difference = np.abs(signature.astype(np.int16) - thumbnail).mean()
+        if difference >= self.threshold:
+            return None
+
+        entry[2] += 1
+        self.hits += 1
+        return result
+
+    def store(self, exam_id, signature, result):
+        """Remember the thumbnail and result of a freshly analyzed frame"""
+        self.sessions[exam_id] = [signature, result, 0]
+        self.sessions.move_to_end(exam_id)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+
+    def release(self, exam_id):
+        self.sessions.pop(exam_id, None)
+
+    def stats(self):
+        return {
+            'threshold': self.threshold,
+            'sessions': len(self.sessions),
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0
+        }
+
+
+# Global frame change detector instance
+frame_changes = FrameChangeDetector()
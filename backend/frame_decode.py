@@ -0,0 +1,122 @@
+"""
+Frame decode stage
+Uploads are read into a reusable buffer instead of fresh bytes objects, and
+JPEG frames larger than the models need are decoded at a reduced scale by
+libjpeg (IMREAD_REDUCED_COLOR_*), which is much cheaper than decoding at
+full resolution and downsampling afterwards.
+"""
+
+import os
+
+import cv2
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from metrics import stage_seconds
+from timing import LatencyWindow
+
+# JPEG start-of-frame markers that carry the image dimensions
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Starlette keeps multipart uploads up to this size in memory, larger ones
+# are spooled to disk
+IN_MEMORY_UPLOAD_BYTES = 1024 * 1024
+
+REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+]
+
+
+def jpeg_size(data):
+    """Read (width, height) from a JPEG header without decoding, or None"""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+
+    position = 2
+    while position + 9 < len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if marker in SOF_MARKERS:
+            height = (data[position + 5] << 8) | data[position + 6]
+            width = (data[position + 7] << 8) | data[position + 8]
+            return width, height
+        segment_length = (data[position + 2] << 8) | data[position + 3]
+        position += 2 + segment_length
+    return None
+
+
+class FrameDecoder:
+    def __init__(self, target_size=None):
+        if target_size is None:
+            target_size = int(os.getenv('FRAME_TARGET_SIZE', 640))
+
+        # Longest side the decoded frame must keep for the models
+        self.target_size = target_size
+        self._buffer = bytearray(256 * 1024)
+
+        self.decode_time = LatencyWindow()
+        self.reduced = 0
+
+    async def read_upload(self, upload):
+        """
+        Read an UploadFile body into the reusable buffer
+        Returns a memoryview that is only valid until the next read, so it
+        must be decoded before the handler awaits anything else.
+        """
+        source = upload.file
+        # SpooledTemporaryFile only has readinto from Python 3.11 on
+        if not hasattr(source, 'readinto'):
+            await upload.seek(0)
+            return memoryview(await upload.read())
+
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+
+        if size > IN_MEMORY_UPLOAD_BYTES:
+            # Spooled to disk, read in a thread into a private buffer
+            buffer = bytearray(size)
+            view = memoryview(buffer)
+            await run_in_threadpool(source.readinto, view)
+            return view
+
+        if size > len(self._buffer):
+            self._buffer = bytearray(size)
+        view = memoryview(self._buffer)[:size]
+        source.readinto(view)
+        return view
+
+    def _reduced_flag(self, data):
+        size = jpeg_size(data)
+        if size is None:
+            return cv2.IMREAD_COLOR
+
+        longest = max(size)
+        for factor, flag in REDUCED_FLAGS:
+            if longest // factor >= self.target_size:
+                self.reduced += 1
+                return flag
+        return cv2.IMREAD_COLOR
+
+    def decode(self, data):
+        """Decode an encoded BGR frame, reduced when it exceeds the target size"""
+        with self.decode_time.time(), stage_seconds.time(stage='decode'):
+            buffer = np.frombuffer(data, np.uint8)
+            return cv2.imdecode(buffer, self._reduced_flag(data))
+
+    def stats(self):
+        stats = self.decode_time.summary()
+        stats['target_size'] = self.target_size
+        stats['reduced_decodes'] = self.reduced
+        return stats
+
+
+# Global frame decoder instance
+frame_decoder = FrameDecoder()
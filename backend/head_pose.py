@@ -0,0 +1,122 @@
+"""
+Vectorized head-pose estimation from FaceMesh landmarks
+Only the six model landmarks (nose tip, chin, eye and mouth corners) of
+each detected face are read into one (faces x 6 x 3) array, and a rigid
+rotation between a generic 3D face model and each face is solved for every
+face at once (batched Kabsch fit), giving continuous yaw, pitch and roll
+angles in degrees.
+
+On the iris-refined mesh the iris centers are located between the eye
+corners and lids, and the eyes' offset is added to the head angles, so a
+student who keeps the head still but looks off screen is still caught.
+"""
+
+import numpy as np
+
+# Nose tip, chin, eye outer corners and mouth corners in MediaPipe indices
+MODEL_INDICES = [1, 152, 33, 263, 61, 291]
+
+# Matching points of a generic 3D face model (x right, y up, z towards camera)
+MODEL_POINTS = np.array([
+    [0.0, 0.0, 0.0],
+    [0.0, -330.0, -65.0],
+    [-225.0, 170.0, -135.0],
+    [225.0, 170.0, -135.0],
+    [-150.0, -150.0, -125.0],
+    [150.0, -150.0, -125.0]
+])
+_MODEL_CENTERED = MODEL_POINTS - MODEL_POINTS.mean(axis=0)
+
+# Iris center, image-left and image-right eye corners, upper and lower lid
+# of both eyes. Iris landmarks (468-477) only exist on the refined mesh
+EYE_INDICES = [
+    [468, 33, 133, 159, 145],
+    [473, 362, 263, 386, 374]
+]
+# Gaze angle (degrees) when the iris touches an eye corner or lid
+IRIS_YAW_DEG = 30.0
+IRIS_PITCH_DEG = 20.0
+
+
+def landmarks_to_array(multi_face_landmarks):
+    """
+    Read the model landmarks of MediaPipe faces into a float64 (faces, 6, 3) array
+    The other mesh points are never touched, so the cost per face stays at
+    a handful of attribute reads instead of one per landmark
+    """
+    landmarks = np.empty((len(multi_face_landmarks), len(MODEL_INDICES), 3))
+    for face_index, face in enumerate(multi_face_landmarks):
+        points = face.landmark
+        for point_index, landmark_index in enumerate(MODEL_INDICES):
+            point = points[landmark_index]
+            landmarks[face_index, point_index] = (point.x, point.y, point.z)
+    return landmarks
+
+
+def iris_offsets(multi_face_landmarks):
+    """
+    Position of the irises within the eyes of refined MediaPipe faces
+    Returns: (faces, 2) horizontal (image right) and vertical (down) offsets
+    in [-1, 1], averaged over both eyes, 0 when looking straight ahead
+    """
+    points = np.empty((len(multi_face_landmarks), len(EYE_INDICES), 5, 2))
+    for face_index, face in enumerate(multi_face_landmarks):
+        landmarks = face.landmark
+        for eye_index, indices in enumerate(EYE_INDICES):
+            for point_index, landmark_index in enumerate(indices):
+                point = landmarks[landmark_index]
+                points[face_index, eye_index, point_index] = (point.x, point.y)
+
+    iris, left, right, upper, lower = np.moveaxis(points, 2, 0)
+    width = right[..., 0] - left[..., 0]
+    height = lower[..., 1] - upper[..., 1]
+    horizontal = (iris[..., 0] - left[..., 0]) / np.where(np.abs(width) < 1e-6, 1e-6, width)
+    vertical = (iris[..., 1] - upper[..., 1]) / np.where(np.abs(height) < 1e-6, 1e-6, height)
+
+    offsets = np.stack([horizontal, vertical], axis=-1).mean(axis=1) * 2 - 1
+    return np.clip(offsets, -1.0, 1.0)
+
+
+def eye_gaze_angles(angles, offsets):
+    """Head yaw/pitch/roll with the eyes' yaw and pitch added to the head's"""
+    gaze = angles.copy()
+    gaze[:, :2] += offsets * np.array([IRIS_YAW_DEG, IRIS_PITCH_DEG])
+    return gaze
+
+
+def estimate_head_pose(landmarks, width, height):
+    """
+    Head pose of every face in a (faces, 6, 3) array of normalized model landmarks
+    width/height are the pixel size of the image the landmarks refer to
+    Returns: (faces, 3) array of yaw, pitch, roll in degrees
+    """
+    if len(landmarks) == 0:
+        return np.empty((0, 3))
+
+    # Normalized image coordinates -> pixel units with y up and z towards camera
+    observed = landmarks * np.array([width, -height, -width])
+    observed -= observed.mean(axis=1, keepdims=True)
+
+    # Batched Kabsch: rotation R with observed ~= R @ model for each face
+    covariance = np.einsum('ni,fnj->fij', _MODEL_CENTERED, observed)
+    u, _, vt = np.linalg.svd(covariance)
+    v = vt.transpose(0, 2, 1)
+    ut = u.transpose(0, 2, 1)
+
+    # Guard against reflections
+    correction = np.ones((len(landmarks), 3))
+    correction[:, 2] = np.sign(np.linalg.det(v @ ut))
+    rotation = (v * correction[:, np.newaxis, :]) @ ut
+
+    yaw = np.arcsin(np.clip(-rotation[:, 2, 0], -1.0, 1.0))
+    pitch = np.arctan2(rotation[:, 2, 1], rotation[:, 2, 2])
+    roll = np.arctan2(rotation[:, 1, 0], rotation[:, 0, 0])
+    return np.degrees(np.stack([yaw, pitch, roll], axis=1))
+
+
+def gaze_scores(angles, yaw_limit, pitch_limit):
+    """
+    How far each face is turned relative to the limits
+    A score above 1 means the face is turned beyond a limit
+    """
+    return np.maximum(np.abs(angles[:, 0]) / yaw_limit, np.abs(angles[:, 1]) / pitch_limit)
@@ -0,0 +1,411 @@
+"""
+Inference Worker Pool
+Runs face proctoring and object detection in dedicated worker processes so a
+MediaPipe pass never blocks the FastAPI event loop.
+
+Each worker process loads its own FaceDetection/FaceMesh graphs and object
+detector once. Decoded frames are copied into pre-allocated shared memory
+slots and only the slot name, shape and dtype cross the process boundary,
+so frames are never pickled. Frames are converted from BGR to RGB while
+being written into the slot, so workers never allocate a converted copy.
+Face analysis runs on the exam's own worker, while object detection is
+micro-batched across exams.
+
+If a worker process dies (e.g. a native MediaPipe crash), its executor is
+replaced by a fresh one and the affected call is retried once, so the exams
+pinned to that worker keep being served.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from detection_batcher import DetectionBatcher
+from metrics import registry, stage_seconds
+
+worker_restarts = registry.counter(
+    'proctoring_inference_worker_restarts_total',
+    'Inference worker processes replaced after they died'
+)
+
+# Largest frame a slot can hold without being downscaled (1080p BGR)
+DEFAULT_SLOT_BYTES = 1920 * 1080 * 3
+
+# Per-process state, populated by _init_worker inside each worker process
+_worker = {}
+
+
+def _init_worker():
+    """Load the proctoring models once per worker process"""
+    from face_identity import FaceIdentity
+    from face_proctoring import FaceProctoring
+    from face_sessions import FaceSessionRegistry
+    from object_detection import ObjectDetection
+
+    # Shared tracker for frames that do not belong to an exam
+    _worker['face_proctoring'] = FaceProctoring()
+    _worker['face_sessions'] = FaceSessionRegistry()
+    _worker['face_identity'] = FaceIdentity()
+    _worker['object_detection'] = ObjectDetection()
+    _worker['segments'] = {}
+
+
+def _attach_frame(slot_name, shape, dtype):
+    """Return a zero-copy view of a frame living in a shared memory slot"""
+    segments = _worker['segments']
+    shm = segments.get(slot_name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=slot_name)
+        segments[slot_name] = shm
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _warm_up_in_worker():
+    """Run one dummy inference so the first real frame pays no setup cost"""
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    _worker['face_proctoring'].analyze_rgb(frame)
+    _worker['object_detection'].detect_objects_batch([frame], rgb=True)
+    if _worker['face_identity'].enabled:
+        _worker['face_identity'].embedder.embed([frame[:112, :112]])
+    # The mock detector has no input size
+    return getattr(_worker['object_detection'].detector, 'input_size', None)
+
+
+def _release_session_in_worker(exam_id):
+    _worker['face_sessions'].release(exam_id)
+    _worker['face_identity'].release(exam_id)
+
+
+def _stats_in_worker():
+    """Face cascade counters and session usage of this worker"""
+    face_sessions = _worker['face_sessions']
+    counters = face_sessions.stage_counters()
+    for name, value in _worker['face_proctoring'].stage_counters.items():
+        counters[name] = counters.get(name, 0) + value
+
+    stats = face_sessions.stats()
+    stats['face_stages'] = counters
+    stats['identity'] = _worker['face_identity'].stats()
+    stats['identity'].pop('enabled')
+    return stats
+
+
+def _merge_counts(total, part):
+    """Sum nested dicts of counters"""
+    for name, value in part.items():
+        if isinstance(value, dict):
+            _merge_counts(total.setdefault(name, {}), value)
+        else:
+            total[name] = total.get(name, 0) + value
+    return total
+
+
+def _analyze_face_in_worker(slot_name, shape, dtype, exam_id=None):
+    """Run face proctoring on a shared frame (executes in a worker)"""
+    frame = _attach_frame(slot_name, shape, dtype)
+    face_proctoring = None
+    if exam_id is not None:
+        face_proctoring = _worker['face_sessions'].get(exam_id)
+    if face_proctoring is None:
+        # No exam, or every session slot is held by an active stream. The
+        # shared tracker sees frames of many students, so every frame is
+        # analyzed from a clean cascade state and always runs the mesh
+        face_proctoring = _worker['face_proctoring']
+        face_proctoring.reset_state()
+
+    face_violations = face_proctoring.analyze_rgb(frame)
+    timings = dict(face_proctoring.timings)
+
+    # Identity checks reuse the detections instead of detecting again
+    face_identity = _worker['face_identity']
+    started = time.perf_counter()
+    identity = face_identity.check(exam_id, frame, face_proctoring.last_detections)
+    if identity is not None:
+        timings['identity'] = time.perf_counter() - started
+    face_violations['identity'] = identity
+
+    summaries = [
+        face_proctoring.get_violation_summary(face_violations),
+        face_identity.get_violation_summary(identity)
+    ]
+    return face_violations, [summary for summary in summaries if summary], timings
+
+
+def _detect_batch_in_worker(frame_refs):
+    """Run one batched object detection over several shared frames"""
+    object_detection = _worker['object_detection']
+    frames = [_attach_frame(*ref) for ref in frame_refs]
+
+    started = time.perf_counter()
+    batch = object_detection.detect_objects_batch(frames, rgb=True)
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for object_violations in batch:
+        results.append((
+            object_violations,
+            object_detection.get_violation_message(object_violations)
+        ))
+    return results, elapsed
+
+
+class FrameSlot:
+    """A reusable shared memory buffer that carries one frame to a worker"""
+
+    def __init__(self, size):
+        self.size = size
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.name = self.shm.name
+
+    def write(self, frame):
+        """Write a BGR frame into the slot as RGB, downscaling it if it does not fit"""
+        if frame.nbytes > self.size:
+            scale = (self.size / frame.nbytes) ** 0.5
+            width = max(1, int(frame.shape[1] * scale))
+            height = max(1, int(frame.shape[0] * scale))
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=view)
+        return frame.shape, frame.dtype.str
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class _Worker:
+    """A single-process executor plus the number of frames queued on it"""
+
+    def __init__(self, context):
+        self.context = context
+        self.executor = self._create_executor()
+        self.pending = 0
+        self.restarts = 0
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=self.context,
+            initializer=_init_worker
+        )
+
+    def replace(self, broken):
+        """Swap a broken executor for a fresh process, once per broken executor"""
+        if self.executor is not broken:
+            # Another call already replaced it
+            return
+        broken.shutdown(wait=False)
+        self.executor = self._create_executor()
+        self.restarts += 1
+        worker_restarts.inc()
+        print("⚠️ Inference worker process died, started a replacement")
+
+
+class InferencePool:
+    def __init__(self):
+        self.num_workers = int(os.getenv('INFERENCE_WORKERS', os.cpu_count() or 1))
+        self.slot_bytes = int(os.getenv('INFERENCE_SLOT_BYTES', DEFAULT_SLOT_BYTES))
+        self.num_slots = int(os.getenv('INFERENCE_FRAME_SLOTS', self.num_workers * 2))
+        self.workers = []
+        self.slots = []
+        self._free_slots = None
+        self.batcher = DetectionBatcher(self._detect_batch)
+        # Input size of the object detector, known once the workers are warm
+        self.detector_input_size = None
+        # Exams whose identity reference was built at least once. A worker
+        # restart loses the reference, a second enrollment is reported
+        self._enrolled_exams = set()
+        self.reenrollments = 0
+
+    async def start(self):
+        """Create the worker executors and shared frame slots"""
+        # MediaPipe graphs are not fork-safe, always start clean interpreters
+        context = multiprocessing.get_context('spawn')
+        self.workers = [_Worker(context) for _ in range(self.num_workers)]
+
+        self.slots = [FrameSlot(self.slot_bytes) for _ in range(self.num_slots)]
+        self._free_slots = asyncio.Queue()
+        for slot in self.slots:
+            self._free_slots.put_nowait(slot)
+
+        self.batcher.start()
+
+    async def warm_up(self):
+        """
+        Spawn every worker, load its models and run a dummy inference
+        Runs in the background after startup; frames that arrive earlier
+        simply wait for their worker to finish loading.
+        """
+        input_sizes = await asyncio.gather(*[
+            self._run(worker, _warm_up_in_worker) for worker in self.workers
+        ])
+        self.detector_input_size = max((size for size in input_sizes if size), default=None)
+        print(f"Inference pool ready: {len(input_sizes)} workers, {len(self.slots)} frame slots")
+
+    async def shutdown(self):
+        await self.batcher.stop()
+        for worker in self.workers:
+            if sys.version_info >= (3, 9):
+                worker.executor.shutdown(wait=True, cancel_futures=True)
+            else:
+                worker.executor.shutdown(wait=True)
+        for slot in self.slots:
+            slot.release()
+        self.workers = []
+        self.slots = []
+        print("Inference pool stopped")
+
+    def pending_frames(self):
+        return sum(worker.pending for worker in self.workers)
+
+    def free_slots(self):
+        return self._free_slots.qsize() if self._free_slots else 0
+
+    async def _run(self, worker, function, *args):
+        """Call a function in a worker process, restarting the process if it died"""
+        loop = asyncio.get_running_loop()
+        executor = worker.executor
+        try:
+            return await loop.run_in_executor(executor, function, *args)
+        except BrokenProcessPool:
+            worker.replace(executor)
+        # Retry once on the fresh process; a frame that crashes it again fails alone
+        executor = worker.executor
+        try:
+            return await loop.run_in_executor(executor, function, *args)
+        except BrokenProcessPool:
+            worker.replace(executor)
+            raise
+
+    def _pick_worker(self, exam_id=None):
+        # Frames of one exam always go to the same worker so its face
+        # tracker keeps seeing a single, continuous stream
+        if exam_id is not None:
+            return self.workers[exam_id % len(self.workers)]
+        return min(self.workers, key=lambda worker: worker.pending)
+
+    async def analyze(self, frame, exam_id=None):
+        """Analyze a decoded BGR frame in a worker process"""
+        slot = await self._free_slots.get()
+        worker = self._pick_worker(exam_id)
+        try:
+            shape, dtype = slot.write(frame)
+        except Exception:
+            self._free_slots.put_nowait(slot)
+            raise
+
+        worker.pending += 1
+        face = asyncio.ensure_future(
+            self._run(worker, _analyze_face_in_worker, slot.name, shape, dtype, exam_id)
+        )
+
+        detection = self.batcher.enqueue((slot.name, shape, dtype))
+        combined = asyncio.gather(face, detection, return_exceptions=True)
+
+        # Workers may still be reading the slot if this request is
+        # cancelled, so only recycle it once both stages are done with it
+        def _done(_):
+            worker.pending -= 1
+            self._free_slots.put_nowait(slot)
+
+        combined.add_done_callback(_done)
+        face_result, detection_result = await asyncio.shield(combined)
+        for result in (face_result, detection_result):
+            if isinstance(result, BaseException):
+                raise result
+
+        face_violations, face_summaries, face_timings = face_result
+        object_violations, object_summary = detection_result
+        self._track_enrollment(exam_id, face_violations.get('identity'), face_summaries)
+
+        # Stage timings measured inside the worker processes
+        for stage, seconds in face_timings.items():
+            stage_seconds.observe(seconds, stage=stage)
+
+        all_violations = face_summaries + ([object_summary] if object_summary else [])
+        return {
+            'face': face_violations,
+            'objects': object_violations,
+            'violations': all_violations
+        }
+
+    def _track_enrollment(self, exam_id, identity, face_summaries):
+        """Turn a repeated enrollment of the same exam into a violation"""
+        if not identity or identity['status'] != 'enrolled':
+            return
+        if exam_id not in self._enrolled_exams:
+            self._enrolled_exams.add(exam_id)
+            return
+
+        identity['status'] = 're_enrolled'
+        self.reenrollments += 1
+        face_summaries.append({
+            'type': 'identity_reenrolled',
+            'severity': 'high',
+            'message': 'Identity reference was lost and enrolled again from the current face'
+        })
+
+    async def _detect_batch(self, frame_refs):
+        """Run a detection batch on the least busy worker"""
+        worker = self._pick_worker()
+        worker.pending += 1
+        try:
+            results, elapsed = await self._run(worker, _detect_batch_in_worker, frame_refs)
+        finally:
+            worker.pending -= 1
+
+        stage_seconds.observe(elapsed, stage='object_detection_batch')
+        return results
+
+    async def release_session(self, exam_id):
+        """Free the face tracker an exam holds in its worker"""
+        self._enrolled_exams.discard(exam_id)
+        if not self.workers:
+            return
+        worker = self._pick_worker(exam_id)
+        await self._run(worker, _release_session_in_worker, exam_id)
+
+    async def stats(self):
+        """Counters aggregated over every worker process"""
+        results = await asyncio.gather(*[
+            self._run(worker, _stats_in_worker) for worker in self.workers
+        ])
+
+        totals = {}
+        for result in results:
+            _merge_counts(totals, result)
+        totals['workers'] = len(self.workers)
+        totals['worker_restarts'] = sum(worker.restarts for worker in self.workers)
+        totals['identity_reenrollments'] = self.reenrollments
+        totals['pending_frames'] = self.pending_frames()
+        totals['detection_batches'] = self.batcher.stats()
+        return totals
+
+
+# Global inference pool instance
+inference_pool = InferencePool()
+
+registry.gauge(
+    'proctoring_inference_pending_frames',
+    'Frames queued or running on inference workers',
+    function=lambda: inference_pool.pending_frames()
+)
+registry.gauge(
+    'proctoring_detection_batch_queue_depth',
+    'Frames waiting for the next object detection batch',
+    function=lambda: inference_pool.batcher.queue_depth()
+)
+registry.gauge(
+    'proctoring_free_frame_slots',
+    'Shared memory frame slots available for new frames',
+    function=lambda: inference_pool.free_slots()
+)
@@ -1,20 +1,35 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Optional, List
 import cv2
 import numpy as np
 import base64
+import asyncio
+import json
+import os
+import time
 from datetime import datetime
 import io
 from PIL import Image
 
-from database import db
-from face_proctoring import FaceProctoring
-from object_detection import ObjectDetection
-from question_generator import QuestionGenerator
+from database import async_db
+from inference_pool import inference_pool
+from frame_cache import frame_changes
+from frame_decode import frame_decoder
+from violation_episodes import violation_episodes
+from violation_writer import violation_writer
+from metrics import registry, stage_seconds
+from capture_policy import capture_policy
+from evidence import evidence
+from admission import admission, AdmissionRejected, PRIORITY_HIGH, PRIORITY_NORMAL
+from question_generator import question_gen
+from question_sampler import question_sampler
+from answer_keys import answer_keys
+from readiness import readiness
+from starlette.concurrency import run_in_threadpool
 
 app = FastAPI(title="AI Proctoring System")
 
@@ -25,12 +40,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the cross-origin frontend read the back-off of 503/429 responses
+    expose_headers=["Retry-After"],
 )
 
-# Initialize proctoring modules
-face_proctoring = FaceProctoring()
-object_detection = ObjectDetection()
-question_gen = QuestionGenerator()  # Now includes both pre-loaded bank and AI
+# Request instrumentation
+requests_in_flight = registry.gauge(
+    'http_requests_in_flight',
+    'HTTP requests currently being handled'
+)
+request_seconds = registry.histogram(
+    'http_request_seconds',
+    'HTTP request latency by route',
+    ['method', 'route', 'status']
+)
+streams_active = registry.gauge(
+    'proctoring_streams_active',
+    'Open proctoring WebSocket streams'
+)
+
+@app.middleware("http")
+async def instrument_requests(request, call_next):
+    started = time.perf_counter()
+    status = 500
+    with requests_in_flight.track_inprogress():
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Label by route template so ids do not create new series
+            route = request.scope.get("route")
+            request_seconds.observe(
+                time.perf_counter() - started,
+                method=request.method,
+                route=route.path if route else "unmatched",
+                status=status
+            )
+
+# Proctoring models run inside the inference pool workers and, like the
+# question generator, are only loaded by the background warm-up
 
 # Pydantic models
 class UserLogin(BaseModel):
@@ -62,20 +111,61 @@ class GenerateQuestionsRequest(BaseModel):
     difficulty: str
     count: int = 5
 
-# Database connection on startup
+async def connect_database():
+    """Build the database connection pool, raises when MySQL is unreachable"""
+    if not await async_db.connect():
+        raise RuntimeError("Could not connect to MySQL")
+
+def after(first, warm_up):
+    """Warm-up that starts once the awaitable first has completed"""
+    async def run():
+        await first
+        await warm_up()
+    return run
+
+# Background services on startup, heavy components warm up afterwards
 @app.on_event("startup")
 async def startup():
-    db.connect()
+    await inference_pool.start()
+    violation_writer.start()
+    violation_episodes.start()
+    evidence.start()
+    app.state.episode_sweeper = asyncio.create_task(violation_episodes.run_sweeper())
+    
+    # Connect to the database and load models and clients after the
+    # server is up, the query caches fill once the pool exists
+    database = asyncio.ensure_future(connect_database())
+    app.state.warm_up = asyncio.create_task(readiness.warm_all({
+        'database': lambda: database,
+        'inference_pool': inference_pool.warm_up,
+        'question_generator': lambda: run_in_threadpool(question_gen.warm_up),
+        'question_sampler': after(database, question_sampler.warm_up),
+        'answer_keys': after(database, answer_keys.warm_up)
+    }))
 
 @app.on_event("shutdown")
 async def shutdown():
-    db.disconnect()
+    app.state.warm_up.cancel()
+    app.state.episode_sweeper.cancel()
+    for exam_id in list(violation_episodes.open_episodes):
+        await violation_episodes.close_exam(exam_id)
+    await violation_episodes.stop()
+    await violation_writer.stop()
+    evidence.stop()
+    await inference_pool.shutdown()
+    await async_db.disconnect()
 
 # Root endpoint
 @app.get("/")
 async def root():
     return {"message": "AI Proctoring System API", "status": "running"}
 
+@app.get("/api/ready")
+async def ready():
+    """Readiness probe, 503 until every component is warm"""
+    stats = readiness.stats()
+    return JSONResponse(stats, status_code=200 if stats['ready'] else 503)
+
 # ==================== USER MANAGEMENT ====================
 
 @app.post("/api/register")
@@ -86,7 +176,7 @@ async def register(user: UserCreate):
         INSERT INTO users (username, password, email) 
         VALUES (%s, %s, %s)
         """
-        db.execute_query(query, (user.username, user.password, user.email))
+        await async_db.execute_query(query, (user.username, user.password, user.email))
         return {"message": "User registered successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Registration failed: {str(e)}")
@@ -95,7 +185,7 @@ async def register(user: UserCreate):
 async def login(user: UserLogin):
     """User login"""
     query = "SELECT * FROM users WHERE username = %s AND password = %s"
-    result = db.fetch_one(query, (user.username, user.password))
+    result = await async_db.fetch_one(query, (user.username, user.password))
     
     if result:
         return {
@@ -146,7 +236,7 @@ async def generate_questions(request: GenerateQuestionsRequest):
         (question_text, option_a, option_b, option_c, option_d, correct_answer, subject, difficulty) 
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """
-        cursor = db.execute_query(query, (
+        cursor = await async_db.execute_query(query, (
             q['question'],
             q['option_a'],
             q['option_b'],
@@ -158,6 +248,12 @@ async def generate_questions(request: GenerateQuestionsRequest):
         ))
         
         if cursor:
+            answer_keys.set(cursor.lastrowid, q['correct_answer'])
+            question_sampler.add(
+                cursor.lastrowid,
+                q.get('subject', request.subject),
+                q.get('difficulty', request.difficulty)
+            )
             stored_questions.append({
                 'id': cursor.lastrowid,
                 **q
@@ -177,7 +273,7 @@ async def create_question(question: QuestionCreate):
     (question_text, option_a, option_b, option_c, option_d, correct_answer, subject, difficulty) 
     VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
     """
-    cursor = db.execute_query(query, (
+    cursor = await async_db.execute_query(query, (
         question.question_text,
         question.option_a,
         question.option_b,
@@ -189,21 +285,19 @@ async def create_question(question: QuestionCreate):
     ))
     
     if cursor:
+        answer_keys.set(cursor.lastrowid, question.correct_answer)
+        question_sampler.add(cursor.lastrowid, question.subject, question.difficulty)
         return {"message": "Question created", "id": cursor.lastrowid}
     raise HTTPException(status_code=500, detail="Failed to create question")
 
 @app.get("/api/questions")
-async def get_questions(limit: int = 20, subject: Optional[str] = None):
+async def get_questions(limit: int = 20, subject: Optional[str] = None, difficulty: Optional[str] = None):
     """Get random questions for exam (max 20)"""
     # FIX: Enforce maximum limit
     limit = min(limit, 20)
     
-    if subject:
-        query = "SELECT * FROM questions WHERE subject = %s ORDER BY RAND() LIMIT %s"
-        questions = db.fetch_all(query, (subject, limit))
-    else:
-        query = "SELECT * FROM questions ORDER BY RAND() LIMIT %s"
-        questions = db.fetch_all(query, (limit,))
+    # Random ids are drawn in memory, only the chosen rows are fetched
+    questions = await question_sampler.sample(limit, subject, difficulty)
     
     # Remove correct answers from response
     for q in questions:
@@ -215,14 +309,14 @@ async def get_questions(limit: int = 20, subject: Optional[str] = None):
 async def get_all_questions():
     """Get all questions with answers (Admin only)"""
     query = "SELECT * FROM questions ORDER BY created_at DESC"
-    questions = db.fetch_all(query)
+    questions = await async_db.fetch_all(query)
     return {"questions": questions, "total": len(questions)}
 
 @app.get("/api/questions/debug")
 async def debug_questions():
     """Debug endpoint to see what's in database"""
     query = "SELECT id, question_text, subject, difficulty FROM questions"
-    questions = db.fetch_all(query)
+    questions = await async_db.fetch_all(query)
     
     # Group by subject
     subjects = {}
@@ -239,6 +333,8 @@ async def debug_questions():
     return {
         "total_questions": len(questions),
         "subjects": subjects,
+        "sampler": question_sampler.stats(),
+        "answer_keys": answer_keys.stats(),
         "sample_questions": questions[:5]
     }
 
@@ -251,7 +347,7 @@ async def start_exam(user_id: int, exam_name: str = "General Exam"):
     INSERT INTO exams (user_id, exam_name, status) 
     VALUES (%s, %s, 'in_progress')
     """
-    cursor = db.execute_query(query, (user_id, exam_name))
+    cursor = await async_db.execute_query(query, (user_id, exam_name))
     
     if cursor:
         return {"message": "Exam started", "exam_id": cursor.lastrowid}
@@ -260,21 +356,20 @@ async def start_exam(user_id: int, exam_name: str = "General Exam"):
 @app.post("/api/exam/submit")
 async def submit_answer(answer: AnswerSubmit):
     """Submit an answer"""
-    # Get correct answer
-    query = "SELECT correct_answer FROM questions WHERE id = %s"
-    result = db.fetch_one(query, (answer.question_id,))
+    # Get correct answer (in-memory answer key, database on a miss)
+    correct_answer = await answer_keys.lookup(answer.question_id)
     
-    if not result:
+    if correct_answer is None:
         raise HTTPException(status_code=404, detail="Question not found")
     
-    is_correct = result['correct_answer'] == answer.user_answer
+    is_correct = correct_answer == answer.user_answer
     
     # Store user answer
     query = """
     INSERT INTO user_answers (exam_id, question_id, user_answer, is_correct) 
     VALUES (%s, %s, %s, %s)
     """
-    db.execute_query(query, (
+    await async_db.execute_query(query, (
         answer.exam_id,
         answer.question_id,
         answer.user_answer,
@@ -294,7 +389,7 @@ async def finish_exam(exam_id: int):
     FROM user_answers 
     WHERE exam_id = %s
     """
-    result = db.fetch_one(query, (exam_id,))
+    result = await async_db.fetch_one(query, (exam_id,))
     
     if result and result['total'] > 0:
         score = (result['correct'] / result['total']) * 100
@@ -307,7 +402,14 @@ async def finish_exam(exam_id: int):
     SET end_time = NOW(), score = %s, status = 'completed' 
     WHERE id = %s
     """
-    db.execute_query(query, (score, exam_id))
+    await async_db.execute_query(query, (score, exam_id))
+    
+    # Free the per-exam face tracker held by the inference worker
+    await inference_pool.release_session(exam_id)
+    frame_changes.release(exam_id)
+    await violation_episodes.close_exam(exam_id)
+    capture_policy.release(exam_id)
+    evidence.release(exam_id)
     
     return {
         "message": "Exam completed",
@@ -321,7 +423,7 @@ async def get_exam_results(exam_id: int):
     """Get detailed exam results"""
     # Get exam info
     exam_query = "SELECT * FROM exams WHERE id = %s"
-    exam = db.fetch_one(exam_query, (exam_id,))
+    exam = await async_db.fetch_one(exam_query, (exam_id,))
     
     # Get all answers
     answers_query = """
@@ -335,11 +437,11 @@ async def get_exam_results(exam_id: int):
     WHERE ua.exam_id = %s
     ORDER BY ua.answered_at
     """
-    answers = db.fetch_all(answers_query, (exam_id,))
+    answers = await async_db.fetch_all(answers_query, (exam_id,))
     
     # Get violations
     violations_query = "SELECT * FROM violations WHERE exam_id = %s ORDER BY timestamp"
-    violations = db.fetch_all(violations_query, (exam_id,))
+    violations = await async_db.fetch_all(violations_query, (exam_id,))
     
     return {
         "exam": exam,
@@ -349,52 +451,93 @@ async def get_exam_results(exam_id: int):
 
 # ==================== PROCTORING ====================
 
+async def run_analysis(contents, exam_id=None):
+    """Decode an encoded frame and analyze it for proctoring violations"""
+    # Turn frames away before decoding when the exam or the queue is busy
+    admission.check(exam_id)
+    
+    frame = frame_decoder.decode(contents)
+    
+    if frame is None:
+        raise ValueError("Invalid image")
+    
+    # Keep the encoded frame as potential evidence for violations
+    if exam_id is not None:
+        evidence.record(exam_id, contents)
+    
+    # Reuse the previous result while the student's scene is unchanged
+    result = None
+    if exam_id is not None:
+        signature = frame_changes.signature(frame)
+        result = frame_changes.lookup(exam_id, signature)
+    
+    if result is None:
+        # Students with open high-severity violations are analyzed first
+        priority = PRIORITY_HIGH if violation_episodes.peak_severity(exam_id) == 'high' else PRIORITY_NORMAL
+        
+        # Analyze with both modules in an inference worker process
+        async with admission.admit(exam_id, priority):
+            with stage_seconds.time(stage='inference'):
+                result = await inference_pool.analyze(frame, exam_id)
+        if exam_id is not None:
+            frame_changes.store(exam_id, signature, result)
+    
+    face_violations = result['face']
+    object_violations = result['objects']
+    all_violations = result['violations']
+    
+    next_capture_ms = capture_policy.recommend(exam_id, all_violations)
+    
+    # Violations of an exam are recorded server-side as episodes
+    if exam_id is not None:
+        await violation_episodes.observe(exam_id, all_violations, interval_ms=next_capture_ms)
+    
+    return {
+        "violations": all_violations,
+        "logged": exam_id is not None,
+        "next_capture_ms": next_capture_ms,
+        "face_analysis": {
+            "face_count": face_violations['face_count'],
+            "multiple_faces": face_violations['multiple_faces'],
+            "no_face": face_violations['no_face'],
+            "looking_away": face_violations['looking_away'],
+            "head_pose": face_violations.get('head_pose'),
+            "identity": face_violations.get('identity')
+        },
+        "object_analysis": {
+            "suspicious_objects": object_violations['suspicious_objects'],
+            "severity": object_violations['severity']
+        }
+    }
+
 @app.post("/api/proctor/analyze")
-async def analyze_frame(file: UploadFile = File(...)):
+async def analyze_frame(
+    file: UploadFile = File(...),
+    exam_id: Optional[int] = Form(None)
+):
     """Analyze a frame for proctoring violations"""
     try:
-        # Read image
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
-            raise HTTPException(status_code=400, detail="Invalid image")
-        
-        # Analyze with both modules
-        face_violations = face_proctoring.analyze_frame(frame)
-        object_violations = object_detection.detect_objects(frame)
-        
-        # Combine results
-        all_violations = []
-        
-        # Add face violations
-        face_summary = face_proctoring.get_violation_summary(face_violations)
-        if face_summary:
-            all_violations.append(face_summary)
-        
-        # Add object violations
-        object_summary = object_detection.get_violation_message(object_violations)
-        if object_summary:
-            all_violations.append(object_summary)
-        
-        return {
-            "violations": all_violations,
-            "face_analysis": {
-                "face_count": face_violations['face_count'],
-                "multiple_faces": face_violations['multiple_faces'],
-                "no_face": face_violations['no_face'],
-                "looking_away": face_violations['looking_away']
-            },
-            "object_analysis": {
-                "suspicious_objects": object_violations['suspicious_objects'],
-                "severity": object_violations['severity']
-            }
-        }
-        
+        # Read image into the decoder's reusable buffer, decoded right away
+        contents = await frame_decoder.read_upload(file)
+        return await run_analysis(contents, exam_id)
+    
+    except AdmissionRejected as e:
+        # retry_after is repeated in the body for clients that cannot read the header
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"detail": e.reason, "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@app.get("/api/proctor/profile")
+async def get_capture_profile():
+    """Frame size, JPEG quality and color mode clients should capture with"""
+    return capture_policy.profile()
+
 @app.post("/api/proctor/violation")
 async def log_violation(
     exam_id: int = Form(...),
@@ -402,22 +545,128 @@ async def log_violation(
     severity: str = Form(...),
     description: str = Form(...)
 ):
-    """Log a proctoring violation"""
-    query = """
-    INSERT INTO violations (exam_id, violation_type, severity, description) 
-    VALUES (%s, %s, %s, %s)
+    """Log a proctoring violation (written by the batched violation writer)"""
+    try:
+        violation_writer.enqueue(exam_id, violation_type, severity, description)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Violation queued"}
+
+# Counters for the frame streaming endpoint
+stream_stats = {"active": 0, "frames": 0, "dropped": 0}
+
+@app.websocket("/ws/proctor/{exam_id}")
+async def proctor_stream(websocket: WebSocket, exam_id: int):
+    """
+    Stream proctoring frames over one connection
+    Binary messages are JPEG frames. Only the newest pending frame is kept,
+    older ones are dropped when analysis falls behind. Text messages carry
+    JSON violation reports, acknowledged on the same socket.
     """
-    cursor = db.execute_query(query, (exam_id, violation_type, severity, description))
+    await websocket.accept()
+    stream_stats["active"] += 1
+    streams_active.inc()
     
-    if cursor:
-        return {"message": "Violation logged", "id": cursor.lastrowid}
-    raise HTTPException(status_code=500, detail="Failed to log violation")
+    pending = {"frame": None}
+    frame_ready = asyncio.Event()
+    send_lock = asyncio.Lock()
+    
+    async def send(message):
+        async with send_lock:
+            await websocket.send_json(message)
+    
+    async def analyze_latest():
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            contents, pending["frame"] = pending["frame"], None
+            try:
+                result = await run_analysis(contents, exam_id)
+                await send({"type": "analysis", **result})
+            except AdmissionRejected as e:
+                await send({"type": "throttled", "detail": e.reason, "retry_after": e.retry_after})
+            except ValueError as e:
+                await send({"type": "error", "detail": str(e)})
+            except Exception as e:
+                await send({"type": "error", "detail": f"Analysis failed: {str(e)}"})
+    
+    analyzer = asyncio.create_task(analyze_latest())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            if message.get("bytes") is not None:
+                stream_stats["frames"] += 1
+                if pending["frame"] is not None:
+                    stream_stats["dropped"] += 1
+                pending["frame"] = message["bytes"]
+                frame_ready.set()
+            elif message.get("text"):
+                # A bad message is answered with an error, the stream stays open
+                try:
+                    data = json.loads(message["text"])
+                    if not isinstance(data, dict):
+                        raise ValueError("Message must be a JSON object")
+                    if data.get("type") == "violation":
+                        violation_writer.enqueue(
+                            exam_id,
+                            data.get("violation_type"),
+                            data.get("severity"),
+                            data.get("description")
+                        )
+                        await send({"type": "violation_ack", "ref": data.get("ref")})
+                except ValueError as e:
+                    # json.JSONDecodeError is a ValueError too
+                    await send({"type": "error", "detail": f"Invalid message: {str(e)}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        analyzer.cancel()
+        stream_stats["active"] -= 1
+        streams_active.dec()
+
+@app.get("/api/proctor/stats")
+async def get_proctor_stats():
+    """Inference pool counters, including face cascade stage skips"""
+    stats = await inference_pool.stats()
+    stats['frame_cache'] = frame_changes.stats()
+    stats['decode'] = frame_decoder.stats()
+    stats['streams'] = stream_stats
+    stats['violation_episodes'] = violation_episodes.stats()
+    stats['violation_writer'] = violation_writer.stats()
+    stats['admission'] = admission.stats()
+    stats['evidence'] = evidence.stats()
+    stats['database'] = async_db.stats()
+    return stats
+
+@app.get("/api/proctor/evidence/{evidence_id}")
+async def get_evidence(evidence_id: str):
+    """Frames stored as evidence for a violation"""
+    manifest = evidence.load_manifest(evidence_id)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Evidence not found")
+    return manifest
+
+@app.get("/api/proctor/evidence/frame/{digest}")
+async def get_evidence_frame(digest: str):
+    """A stored evidence frame by its SHA-256 digest"""
+    path = evidence.frame_path(digest)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Frame not found")
+    return FileResponse(path, media_type="image/jpeg")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text-format metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/api/proctor/violations/{exam_id}")
 async def get_violations(exam_id: int):
     """Get all violations for an exam"""
     query = "SELECT * FROM violations WHERE exam_id = %s ORDER BY timestamp DESC"
-    violations = db.fetch_all(query, (exam_id,))
+    violations = await async_db.fetch_all(query, (exam_id,))
     return {"violations": violations, "count": len(violations)}
 
 # ==================== STATISTICS ====================
@@ -434,7 +683,7 @@ async def get_user_stats(user_id: int):
     FROM exams 
     WHERE user_id = %s AND status = 'completed'
     """
-    stats = db.fetch_one(query, (user_id,))
+    stats = await async_db.fetch_one(query, (user_id,))
     
     # Get recent exams
     exams_query = """
@@ -443,7 +692,7 @@ async def get_user_stats(user_id: int):
     ORDER BY start_time DESC 
     LIMIT 10
     """
-    recent_exams = db.fetch_all(exams_query, (user_id,))
+    recent_exams = await async_db.fetch_all(exams_query, (user_id,))
     
     return {
         "statistics": stats,
@@ -0,0 +1,237 @@
+"""
+Schema migration runner
+Applies the numbered SQL files in migrations/ (NNN_name.sql) in order and
+records each applied version in the schema_migrations table.
+
+Statements that fail only because their table, column or index already
+exists are skipped, so a database created from schema.sql can be adopted
+and ends up with the same schema as one built by the migrations.
+
+Usage:
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # list applied and pending migrations
+    python migrate.py --check    # EXPLAIN the hot queries, fail on any full table scan
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+from contextlib import closing
+
+import mysql.connector
+from mysql.connector import Error
+
+from answer_keys import LOOKUP_QUERY
+from database import db
+from question_sampler import REFRESH_QUERY, sample_query
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Table exists, duplicate column, duplicate index
+ALREADY_APPLIED_ERRORS = {1050, 1060, 1061}
+
+# Hot queries of the main.py handlers with sample parameters, copied
+# verbatim; --check fails when one no longer appears in main.py
+MAIN_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+MAIN_QUERIES = [
+    ('login', "SELECT * FROM users WHERE username = %s AND password = %s", ('admin', 'admin123')),
+    ('finish_exam', """
+    SELECT 
+        COUNT(*) as total,
+        SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END) as correct
+    FROM user_answers 
+    WHERE exam_id = %s
+    """, (1,)),
+    ('exam_results_exam', "SELECT * FROM exams WHERE id = %s", (1,)),
+    ('exam_results_answers', """
+    SELECT 
+        ua.*, 
+        q.question_text, 
+        q.option_a, q.option_b, q.option_c, q.option_d,
+        q.correct_answer
+    FROM user_answers ua
+    JOIN questions q ON ua.question_id = q.id
+    WHERE ua.exam_id = %s
+    ORDER BY ua.answered_at
+    """, (1,)),
+    ('exam_results_violations', "SELECT * FROM violations WHERE exam_id = %s ORDER BY timestamp", (1,)),
+    ('get_violations', "SELECT * FROM violations WHERE exam_id = %s ORDER BY timestamp DESC", (1,)),
+    ('user_stats', """
+    SELECT 
+        COUNT(*) as total_exams,
+        AVG(score) as average_score,
+        MAX(score) as best_score,
+        MIN(score) as worst_score
+    FROM exams 
+    WHERE user_id = %s AND status = 'completed'
+    """, (1,)),
+    ('user_recent_exams', """
+    SELECT * FROM exams 
+    WHERE user_id = %s 
+    ORDER BY start_time DESC 
+    LIMIT 10
+    """, (1,))
+]
+
+# Hot queries the caches run on behalf of get_questions and submit_answer
+HOT_QUERIES = MAIN_QUERIES + [
+    ('question_sampler_refresh', REFRESH_QUERY, (0,)),
+    ('question_sampler_sample', sample_query(3), (1, 2, 3)),
+    ('answer_key_lookup', LOOKUP_QUERY, (1,))
+]
+
+# Tables the hot queries read, their statistics are refreshed before EXPLAIN
+HOT_TABLES = ['users', 'questions', 'exams', 'user_answers', 'violations']
+
+
+def load_migrations():
+    """(version, name, path) of every migration file, in version order"""
+    migrations = []
+    for path in glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql')):
+        match = re.match(r'(\d+)_(\w+)\.sql$', os.path.basename(path))
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), path))
+    return sorted(migrations)
+
+
+def split_statements(sql):
+    """Split a migration file into statements, dropping comment lines"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+def ensure_database():
+    """Create the configured database if it does not exist yet"""
+    conn = mysql.connector.connect(host=db.host, user=db.user, password=db.password)
+    try:
+        with closing(conn.cursor()) as cursor:
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{db.database}`")
+    finally:
+        conn.close()
+
+
+def applied_versions(conn):
+    with closing(conn.cursor()) as cursor:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migration(conn, version, name, path):
+    with open(path) as f:
+        statements = split_statements(f.read())
+
+    with closing(conn.cursor()) as cursor:
+        for statement in statements:
+            try:
+                cursor.execute(statement)
+            except Error as e:
+                if e.errno not in ALREADY_APPLIED_ERRORS:
+                    raise
+                print(f"  skipped, already present: {e.msg}")
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+            (version, name)
+        )
+    conn.commit()
+
+
+def migrate(status_only=False):
+    with db.connection() as conn:
+        applied = applied_versions(conn)
+        pending = [migration for migration in load_migrations() if migration[0] not in applied]
+
+        if status_only:
+            for version, name, _ in load_migrations():
+                state = 'applied' if version in applied else 'pending'
+                print(f"{version:03d} {name}: {state}")
+            return 0
+
+        if not pending:
+            print("✅ Schema is up to date")
+        for version, name, path in pending:
+            print(f"Applying {version:03d} {name}...")
+            apply_migration(conn, version, name, path)
+        if pending:
+            print(f"✅ Applied {len(pending)} migration(s)")
+    return 0
+
+
+def _normalize(sql):
+    return ' '.join(sql.split())
+
+
+def stale_queries():
+    """Names of MAIN_QUERIES that no longer appear verbatim in main.py"""
+    with open(MAIN_PY) as f:
+        source = _normalize(f.read())
+    return [name for name, query, _ in MAIN_QUERIES if _normalize(query) not in source]
+
+
+def check_query_plans():
+    """
+    EXPLAIN every hot query and fail on any full table scan
+    On the small tables of a fresh database MySQL would rather scan than
+    use an index, so table statistics are refreshed first and the session
+    caps the assumed cost of an index lookup (max_seeks_for_key), which
+    makes the optimizer pick an index whenever one applies. A remaining
+    scan means no index fits the query.
+    """
+    failures = []
+    for name in stale_queries():
+        failures.append(name)
+        print(f"❌ {name}: query changed in main.py, update HOT_QUERIES in migrate.py")
+
+    with db.connection() as conn:
+        with closing(conn.cursor(dictionary=True, buffered=True)) as cursor:
+            cursor.execute("ANALYZE TABLE " + ', '.join(HOT_TABLES))
+            cursor.fetchall()
+            cursor.execute("SET SESSION max_seeks_for_key = 1")
+            try:
+                for name, query, params in HOT_QUERIES:
+                    cursor.execute("EXPLAIN " + query, params)
+                    for row in cursor.fetchall():
+                        if row.get('type') == 'ALL':
+                            failures.append(name)
+                            print(f"❌ {name}: full table scan of {row['table']}")
+            finally:
+                # Pooled connections keep session settings
+                cursor.execute("SET SESSION max_seeks_for_key = DEFAULT")
+
+    if failures:
+        print(f"❌ {len(failures)} hot query check(s) failed")
+        return 1
+    print(f"✅ All {len(HOT_QUERIES)} hot queries use an index")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply numbered schema migrations')
+    parser.add_argument('--status', action='store_true', help='list applied and pending migrations')
+    parser.add_argument('--check', action='store_true', help='EXPLAIN the hot queries after migrating')
+    args = parser.parse_args()
+
+    if not args.status:
+        ensure_database()
+    if db.connect() is None:
+        return 2
+
+    try:
+        exit_code = migrate(status_only=args.status)
+        if args.check and exit_code == 0:
+            exit_code = check_query_plans()
+    finally:
+        db.disconnect()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
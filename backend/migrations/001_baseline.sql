@@ -0,0 +1,70 @@
+-- Baseline schema of the AI Proctoring System
+-- Tables use IF NOT EXISTS so databases created from an older schema.sql
+-- can be adopted by the migration runner
+
+-- Users table
+CREATE TABLE IF NOT EXISTS users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(100) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    email VARCHAR(100),
+    is_admin BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Questions table
+CREATE TABLE IF NOT EXISTS questions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    question_text TEXT NOT NULL,
+    option_a VARCHAR(500),
+    option_b VARCHAR(500),
+    option_c VARCHAR(500),
+    option_d VARCHAR(500),
+    correct_answer CHAR(1) NOT NULL,
+    subject VARCHAR(100),
+    difficulty VARCHAR(50),
+    created_by INT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (created_by) REFERENCES users(id)
+);
+
+-- Exams table
+CREATE TABLE IF NOT EXISTS exams (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    exam_name VARCHAR(200),
+    start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    end_time TIMESTAMP NULL,
+    total_questions INT DEFAULT 20,
+    score FLOAT DEFAULT 0,
+    status VARCHAR(50) DEFAULT 'in_progress',
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+-- User answers table
+CREATE TABLE IF NOT EXISTS user_answers (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    exam_id INT NOT NULL,
+    question_id INT NOT NULL,
+    user_answer CHAR(1),
+    is_correct BOOLEAN,
+    answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (exam_id) REFERENCES exams(id),
+    FOREIGN KEY (question_id) REFERENCES questions(id)
+);
+
+-- Proctoring violations table
+CREATE TABLE IF NOT EXISTS violations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    exam_id INT NOT NULL,
+    violation_type VARCHAR(100) NOT NULL,
+    severity VARCHAR(50),
+    description TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (exam_id) REFERENCES exams(id)
+);
+
+-- Insert default admin user (password: admin123)
+INSERT INTO users (username, password, email, is_admin) 
+VALUES ('admin', 'admin123', 'admin@proctoring.com', TRUE)
+ON DUPLICATE KEY UPDATE username=username;
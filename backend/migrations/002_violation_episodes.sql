@@ -0,0 +1,4 @@
+-- Violation episodes (start/end time and frame count) and evidence links
+ALTER TABLE violations ADD COLUMN end_time TIMESTAMP NULL;
+ALTER TABLE violations ADD COLUMN frame_count INT DEFAULT 1;
+ALTER TABLE violations ADD COLUMN evidence_id VARCHAR(32) NULL;
@@ -0,0 +1,15 @@
+-- Composite indexes for the queries on the exam and proctoring hot paths
+-- Each one also serves its foreign key, so MySQL drops the index it created
+-- implicitly for that key
+
+-- finish_exam score and get_exam_results answers (ordered by answered_at)
+CREATE INDEX idx_user_answers_exam ON user_answers (exam_id, answered_at);
+
+-- get_exam_results and get_violations (ordered by timestamp)
+CREATE INDEX idx_violations_exam_time ON violations (exam_id, timestamp);
+
+-- Question sampling by subject and difficulty
+CREATE INDEX idx_questions_subject_difficulty ON questions (subject, difficulty);
+
+-- get_user_stats (completed exams, recent exams by start_time)
+CREATE INDEX idx_exams_user_status_start ON exams (user_id, status, start_time);
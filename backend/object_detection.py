@@ -1,21 +1,233 @@
 """
-Simplified Object Detection Module
-This version uses a mock detector to avoid dependency issues
-For production, you can integrate YOLO when dependencies are resolved
+Object Detection Module
+Runs an exported YOLO-family model through ONNX Runtime on CPU, so real
+detections do not require torch in the API process. Falls back to a mock
+detector when onnxruntime or the model file is not available.
 """
 
+import ast
+import os
+
 import cv2
 import numpy as np
 
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+DEFAULT_MODEL_PATH = '../models/yolov8n.onnx'
+
+# COCO class names, used when the model carries no 'names' metadata
+COCO_CLASSES = [
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck',
+    'boat', 'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench',
+    'bird', 'cat', 'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra',
+    'giraffe', 'backpack', 'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee',
+    'skis', 'snowboard', 'sports ball', 'kite', 'baseball bat', 'baseball glove',
+    'skateboard', 'surfboard', 'tennis racket', 'bottle', 'wine glass', 'cup',
+    'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich', 'orange',
+    'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch',
+    'potted plant', 'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse',
+    'remote', 'keyboard', 'cell phone', 'microwave', 'oven', 'toaster', 'sink',
+    'refrigerator', 'book', 'clock', 'vase', 'scissors', 'teddy bear',
+    'hair drier', 'toothbrush'
+]
+
+
+def letterbox(frame, size, pad_value=114, rgb=False):
+    """
+    Resize a BGR (or RGB) frame to fit a size x size square, keeping the aspect ratio
+    Returns: (1, 3, size, size) float32 RGB tensor, scale ratio, (pad_x, pad_y)
+    """
+    height, width = frame.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width = int(round(width * ratio))
+    new_height = int(round(height * ratio))
+    pad_x = (size - new_width) // 2
+    pad_y = (size - new_height) // 2
+    
+    resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    
+    canvas = np.full((size, size, 3), pad_value, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_height, pad_x:pad_x + new_width] = resized
+    
+    # HWC uint8 -> RGB CHW float32 in [0, 1]
+    if not rgb:
+        canvas = canvas[:, :, ::-1]
+    tensor = canvas.transpose(2, 0, 1)[np.newaxis]
+    tensor = np.ascontiguousarray(tensor, dtype=np.float32)
+    tensor *= 1.0 / 255.0
+    return tensor, ratio, (pad_x, pad_y)
+
+
+def non_max_suppression(boxes, scores, class_ids, iou_threshold=0.45):
+    """
+    Class-aware NMS over (N, 4) xyxy boxes
+    Boxes of different classes are shifted apart so a single pass never
+    suppresses across classes. Returns indices of the boxes to keep.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    offsets = class_ids.astype(np.float32)[:, None] * (boxes.max() + 1)
+    shifted = boxes + offsets
+    x1, y1, x2, y2 = shifted[:, 0], shifted[:, 1], shifted[:, 2], shifted[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        
+        inter_w = np.maximum(0.0, np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]))
+        inter_h = np.maximum(0.0, np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]))
+        inter = inter_w * inter_h
+        iou = inter / (areas[best] + areas[rest] - inter + 1e-9)
+        
+        order = rest[iou <= iou_threshold]
+    
+    return np.array(keep, dtype=np.int64)
+
+
+class MockDetector:
+    """Randomly reports objects, for demos without a model file"""
+    
+    def __init__(self):
+        print("Initialized Simplified Object Detection (Mock Mode)")
+        print(f"To enable real detection, export a YOLO model to {DEFAULT_MODEL_PATH}")
+    
+    def detect(self, frame, class_names):
+        import random
+        
+        # 10% chance to detect a suspicious object (for demo)
+        if random.random() < 0.1:
+            detected = random.choice(['cell phone', 'book', 'laptop'])
+            return [(detected, round(random.uniform(0.5, 0.95), 2))]
+        return []
+    
+    def detect_batch(self, frames, class_names, rgb=False):
+        return [self.detect(frame, class_names) for frame in frames]
+
+
+class OnnxYoloDetector:
+    """YOLOv5/YOLOv8 ONNX model running on the ONNX Runtime CPU provider"""
+    
+    def __init__(self, model_path, confidence=0.5, iou_threshold=0.45, threads=1):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else 640
+        # None when the model was exported with a dynamic batch axis
+        self.fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        
+        self.class_names = self._load_class_names()
+        self.confidence = confidence
+        self.iou_threshold = iou_threshold
+        print(f"Initialized ONNX object detection: {model_path} ({self.input_size}px)")
+    
+    def _load_class_names(self):
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if 'names' in metadata:
+            names = ast.literal_eval(metadata['names'])
+            return [names[i] for i in sorted(names)]
+        return COCO_CLASSES
+    
+    def detect(self, frame, class_names):
+        """Return (class_name, confidence) pairs for the requested classes"""
+        return self.detect_batch([frame], class_names)[0]
+    
+    def detect_batch(self, frames, class_names, rgb=False):
+        """Run one inference over several frames, one result list per frame"""
+        letterboxed = [letterbox(frame, self.input_size, rgb=rgb) for frame in frames]
+        tensor = np.concatenate([item[0] for item in letterboxed])
+        
+        step = self.fixed_batch or len(frames)
+        outputs = []
+        for start in range(0, len(frames), step):
+            chunk = tensor[start:start + step]
+            if len(chunk) < step:
+                # Static batch models need a full batch, pad with blank frames
+                padding = np.zeros((step - len(chunk),) + chunk.shape[1:], dtype=chunk.dtype)
+                chunk = np.concatenate([chunk, padding])
+            outputs.extend(self.session.run(None, {self.input_name: chunk})[0])
+        
+        return [
+            self._postprocess(outputs[i], ratio, pad, class_names)
+            for i, (_, ratio, pad) in enumerate(letterboxed)
+        ]
+    
+    def _postprocess(self, output, ratio, pad, class_names):
+        # YOLOv8 emits (4 + classes, anchors), YOLOv5 (anchors, 5 + classes)
+        if output.shape[0] < output.shape[1]:
+            output = output.T
+        num_classes = len(self.class_names)
+        if output.shape[1] == num_classes + 5:
+            scores = output[:, 5:] * output[:, 4:5]
+        else:
+            scores = output[:, 4:]
+        
+        # Only score the classes we care about
+        wanted = [i for i, name in enumerate(self.class_names) if name in class_names]
+        if not wanted:
+            return []
+        scores = scores[:, wanted]
+        best = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), best]
+        
+        mask = confidences > self.confidence
+        if not mask.any():
+            return []
+        candidates = output[mask, :4]
+        confidences = confidences[mask]
+        class_ids = np.asarray(wanted)[best[mask]]
+        
+        # cx, cy, w, h in letterbox space -> x1, y1, x2, y2 in frame space
+        boxes = np.empty_like(candidates)
+        boxes[:, 0] = candidates[:, 0] - candidates[:, 2] / 2
+        boxes[:, 1] = candidates[:, 1] - candidates[:, 3] / 2
+        boxes[:, 2] = candidates[:, 0] + candidates[:, 2] / 2
+        boxes[:, 3] = candidates[:, 1] + candidates[:, 3] / 2
+        boxes[:, [0, 2]] -= pad[0]
+        boxes[:, [1, 3]] -= pad[1]
+        boxes /= ratio
+        
+        keep = non_max_suppression(boxes, confidences, class_ids, self.iou_threshold)
+        return [
+            (self.class_names[class_ids[i]], round(float(confidences[i]), 2))
+            for i in keep
+        ]
+
+
+def quantize_model(model_path, output_path=None):
+    """Write a dynamically int8-quantized copy of an ONNX model"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    
+    if output_path is None:
+        output_path = model_path.replace('.onnx', '.int8.onnx')
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+    print(f"Quantized model written to {output_path}")
+    return output_path
+
+
 class ObjectDetection:
     def __init__(self):
         """
-        Initialize simplified object detector
-        This is a placeholder that simulates object detection
+        Initialize object detector
+        OBJECT_DETECTION_BACKEND selects 'onnx' or 'mock'; 'auto' uses ONNX
+        whenever onnxruntime and the model file are available
         """
-        print("Initialized Simplified Object Detection (Mock Mode)")
-        print("To enable YOLO detection, fix torch/ultralytics dependencies")
-        
         # Define suspicious objects (same as original)
         self.suspicious_objects = {
             'cell phone': 'high',
@@ -28,74 +240,69 @@ class ObjectDetection:
             'backpack': 'low'
         }
         
-        # Mock detection mode
-        self.use_mock = True
+        backend = os.getenv('OBJECT_DETECTION_BACKEND', 'auto').lower()
+        model_path = os.getenv('OBJECT_DETECTION_MODEL', DEFAULT_MODEL_PATH)
+        
+        # Prefer the int8 model next to the float one when asked for
+        if os.getenv('OBJECT_DETECTION_INT8', 'false').lower() == 'true':
+            int8_path = model_path.replace('.onnx', '.int8.onnx')
+            if os.path.exists(int8_path):
+                model_path = int8_path
+            else:
+                print(f"⚠️ {int8_path} not found, using {model_path}")
+        
+        onnx_available = ort is not None and os.path.exists(model_path)
+        if backend == 'onnx' and not onnx_available:
+            print(f"⚠️ ONNX backend requested but unavailable ({model_path}), using mock")
+        
+        if backend != 'mock' and onnx_available:
+            self.detector = OnnxYoloDetector(
+                model_path,
+                confidence=float(os.getenv('OBJECT_DETECTION_CONFIDENCE', 0.5)),
+                threads=int(os.getenv('OBJECT_DETECTION_THREADS', 1))
+            )
+            self.use_mock = False
+        else:
+            self.detector = MockDetector()
+            self.use_mock = True
     
     def detect_objects(self, frame):
         """
         Detect objects in frame
-        Currently using mock detection to avoid dependency issues
-        
-        To enable real YOLO detection:
-        1. Fix torch/ultralytics compatibility
-        2. Set self.use_mock = False
-        3. Uncomment the real YOLO code below
+        Returns: dict with suspicious objects and overall severity
         """
-        
+        return self._to_violations(self.detector.detect(frame, self.suspicious_objects))
+    
+    def detect_objects_batch(self, frames, rgb=False):
+        """Detect objects in several frames with a single batched inference"""
+        detections = self.detector.detect_batch(frames, self.suspicious_objects, rgb=rgb)
+        return [self._to_violations(items) for items in detections]
+    
+    def _to_violations(self, detections):
+        """Map (class_name, confidence) pairs onto the severity table"""
         violations = {
             'suspicious_objects': [],
             'severity': 'none',
             'detected_items': []
         }
         
-        if self.use_mock:
-            # Mock detection - randomly detect objects for demo purposes
-            # In production, replace this with actual YOLO detection
-            import random
+        for class_name, confidence in detections:
+            severity = self.suspicious_objects[class_name]
             
-            # 10% chance to detect a suspicious object (for demo)
-            if random.random() < 0.1:
-                mock_objects = ['cell phone', 'book', 'laptop']
-                detected = random.choice(mock_objects)
-                severity = self.suspicious_objects[detected]
-                
-                violations['suspicious_objects'].append({
-                    'object': detected,
-                    'confidence': round(random.uniform(0.5, 0.95), 2),
-                    'severity': severity
-                })
-                
-                violations['detected_items'].append(detected)
-                violations['severity'] = severity
-        
-        # REAL YOLO DETECTION CODE (uncomment when dependencies are fixed):
-        """
-        else:
-            results = self.model(frame, verbose=False)
+            violations['suspicious_objects'].append({
+                'object': class_name,
+                'confidence': confidence,
+                'severity': severity
+            })
             
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
-                    class_id = int(box.cls[0])
-                    class_name = self.model.names[class_id]
-                    confidence = float(box.conf[0])
-                    
-                    if class_name in self.suspicious_objects and confidence > 0.5:
-                        severity = self.suspicious_objects[class_name]
-                        
-                        violations['suspicious_objects'].append({
-                            'object': class_name,
-                            'confidence': confidence,
-                            'severity': severity
-                        })
-                        
-                        violations['detected_items'].append(class_name)
-                        
-                        if severity == 'high':
-                            violations['severity'] = 'high'
-                        elif severity == 'medium' and violations['severity'] != 'high':
-                            violations['severity'] = 'medium'
-        """
+            violations['detected_items'].append(class_name)
+            
+            if severity == 'high':
+                violations['severity'] = 'high'
+            elif severity == 'medium' and violations['severity'] != 'high':
+                violations['severity'] = 'medium'
+            elif violations['severity'] == 'none':
+                violations['severity'] = severity
         
         return violations
     
@@ -111,43 +318,23 @@ class ObjectDetection:
         return None
 
 
-# Instructions to enable real YOLO detection:
+# Exporting a model for the ONNX backend:
+"""
+TO ENABLE REAL OBJECT DETECTION:
+
+1. Export a YOLO model to ONNX (on any machine with ultralytics installed):
+   yolo export model=yolov8n.pt format=onnx imgsz=640 dynamic=True
+
+2. Copy yolov8n.onnx to ../models/ (or set OBJECT_DETECTION_MODEL)
+
+3. Optionally build an int8 model and set OBJECT_DETECTION_INT8=true:
+   python object_detection.py --quantize ../models/yolov8n.onnx
 """
-TO ENABLE REAL YOLO OBJECT DETECTION:
-
-1. Fix PyTorch/Ultralytics compatibility:
-   pip uninstall torch torchvision ultralytics -y
-   pip install torch==2.0.1 torchvision==0.15.2
-   pip install ultralytics==8.0.200
-
-2. Replace the code in __init__ with:
-
-   def __init__(self):
-       from ultralytics import YOLO
-       import os
-       
-       model_path = '../models/yolov8n.pt'
-       
-       if not os.path.exists(model_path):
-           print("Downloading YOLOv8 model...")
-           self.model = YOLO('yolov8n.pt')
-       else:
-           self.model = YOLO(model_path)
-       
-       self.suspicious_objects = {
-           'cell phone': 'high',
-           'book': 'medium',
-           'laptop': 'high',
-           'tablet': 'high',
-           'mouse': 'low',
-           'keyboard': 'low',
-           'remote': 'medium',
-           'backpack': 'low'
-       }
-       
-       self.use_mock = False
-
-3. Uncomment the real YOLO detection code in detect_objects method
-
-For now, the system works with mock detection for demonstration.
-"""
\ No newline at end of file
+
+if __name__ == "__main__":
+    import sys
+    
+    if len(sys.argv) == 3 and sys.argv[1] == '--quantize':
+        quantize_model(sys.argv[2])
+    else:
+        print("Usage: python object_detection.py --quantize <model.onnx>")
@@ -4,42 +4,90 @@
 import os
 import random
 import json
+import threading
 import time
 from typing import List, Dict
-from groq import Groq
 from dotenv import load_dotenv
 
+from metrics import registry
+
 load_dotenv()
 
+groq_calls = registry.counter(
+    'groq_calls_total',
+    'Groq question generation calls by outcome',
+    ['outcome']
+)
+groq_seconds = registry.histogram(
+    'groq_call_seconds',
+    'Latency of Groq question generation calls',
+    buckets=(0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0)
+)
+generation_seconds = registry.histogram(
+    'question_generation_seconds',
+    'Latency of generate_questions by question source',
+    ['source']
+)
+
 class QuestionGenerator:
     def __init__(self):
-        """Initialize with Groq API and pre-loaded question bank"""
-        
-        # Groq API setup
+        """
+        Read the configuration only, the Groq client and the pre-loaded
+        question bank are built on first use (or by warm_up)
+        """
         self.groq_enabled = os.getenv('GROQ_ENABLED', 'true').lower() == 'true'
         self.groq_timeout = int(os.getenv('GROQ_TIMEOUT', 5))  # seconds
         
+        self._groq_client = None
+        self._groq_initialized = False
+        self._question_bank = None
+        self._init_lock = threading.Lock()
+    
+    @property
+    def groq_client(self):
+        if not self._groq_initialized:
+            with self._init_lock:
+                if not self._groq_initialized:
+                    self._init_groq()
+        return self._groq_client
+    
+    @property
+    def question_bank(self):
+        if self._question_bank is None:
+            with self._init_lock:
+                if self._question_bank is None:
+                    self._load_question_bank()
+        return self._question_bank
+    
+    def warm_up(self):
+        """Build the Groq client and question bank ahead of the first request"""
+        return self.groq_client is not None, self._count_questions()
+    
+    def _init_groq(self):
+        """Groq API setup"""
         if self.groq_enabled:
             try:
                 api_key = os.getenv('GROQ_API_KEY')
                 if api_key:
-                    self.groq_client = Groq(api_key=api_key)
+                    from groq import Groq
+                    self._groq_client = Groq(api_key=api_key)
                     print("✅ Groq API initialized successfully")
                 else:
                     print("⚠️ GROQ_API_KEY not found, using pre-loaded questions only")
-                    self.groq_client = None
                     self.groq_enabled = False
             except Exception as e:
                 print(f"⚠️ Failed to initialize Groq: {e}")
-                self.groq_client = None
+                self._groq_client = None
                 self.groq_enabled = False
         else:
-            self.groq_client = None
             print("ℹ️ Groq disabled, using pre-loaded questions only")
-
         
+        # Only now, readers skipping the lock must never see a half-built client
+        self._groq_initialized = True
+    
+    def _load_question_bank(self):
         # 120 Pre-loaded questions (10 per subject per difficulty)
-        self.question_bank = {
+        question_bank = {
             "Mathematics": {
                 "easy": [
                     {
@@ -614,6 +662,7 @@ class QuestionGenerator:
             }
         }
         
+        self._question_bank = question_bank
         print(f"✅ Pre-loaded question bank ready: {self._count_questions()} questions")
     
     def _count_questions(self):
@@ -650,7 +699,13 @@ class QuestionGenerator:
         """
         
         count = min(count, 20)  # Max 20 questions
-        
+        started = time.perf_counter()
+        result = self._generate(subject, difficulty, count)
+        generation_seconds.observe(time.perf_counter() - started, source=result["source"])
+        return result
+    
+    def _generate(self, subject: str, difficulty: str, count: int) -> Dict:
+        """Pick the generation strategy for an already capped count"""
         print(f"\n🔄 Generating {count} {difficulty} questions for {subject}...")
         
         # Strategy selection
@@ -690,6 +745,7 @@ class QuestionGenerator:
         """Generate questions using Groq API with timeout"""
         
         if not self.groq_client:
+            groq_calls.inc(outcome='disabled')
             return []
         
         start_time = time.time()
@@ -735,11 +791,13 @@ Generate now:"""
             )
             
             elapsed = time.time() - start_time
+            groq_seconds.observe(elapsed)
             print(f"⏱️ Groq response time: {elapsed:.2f}s")
             
             # Check timeout
             if elapsed > self.groq_timeout:
                 print(f"⚠️ Groq exceeded timeout ({self.groq_timeout}s)")
+                groq_calls.inc(outcome='timeout')
                 return []
             
             # Parse response
@@ -772,14 +830,19 @@ Generate now:"""
             
             if validated:
                 print(f"✅ Validated {len(validated)} Groq questions")
+                groq_calls.inc(outcome='success')
+            else:
+                groq_calls.inc(outcome='empty')
             
             return validated
             
         except json.JSONDecodeError as e:
             print(f"❌ Failed to parse Groq response as JSON: {e}")
+            groq_calls.inc(outcome='parse_error')
             return []
         except Exception as e:
             print(f"❌ Groq API error: {e}")
+            groq_calls.inc(outcome='api_error')
             return []
     def _validate_question(self, q: Dict) -> bool:
         """Validate question format"""
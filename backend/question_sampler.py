@@ -0,0 +1,156 @@
+"""
+Random question sampling
+Replaces ORDER BY RAND(), which reads and sorts every matching row on each
+exam start. The ids of all questions are kept in memory as compact int
+arrays per (subject, difficulty). A sample draws random positions across
+the matching arrays and only those rows are fetched by primary key, so exam
+start does not slow down as the question table grows.
+
+Questions inserted by this process are added right away. Refreshes load
+ids above a watermark that only advances with rows read from the database,
+so ids added locally never hide older rows another process committed.
+"""
+
+import asyncio
+import os
+import random
+import time
+from array import array
+from bisect import bisect_right
+
+from mysql.connector import Error
+
+from database import async_db
+
+# Also EXPLAINed by migrate.py --check
+REFRESH_QUERY = "SELECT id, subject, difficulty FROM questions WHERE id > %s ORDER BY id"
+
+
+def sample_query(count):
+    """Query fetching count questions by id"""
+    placeholders = ', '.join(['%s'] * count)
+    return f"SELECT * FROM questions WHERE id IN ({placeholders})"
+
+
+class QuestionSampler:
+    def __init__(self, refresh_seconds=None):
+        if refresh_seconds is None:
+            refresh_seconds = float(os.getenv('QUESTION_SAMPLER_REFRESH_SECONDS', 30))
+
+        # Questions inserted by other server processes are picked up by
+        # loading ids above the highest known one at most this often
+        self.refresh_seconds = refresh_seconds
+
+        # (subject, difficulty) -> array of question ids
+        self.groups = {}
+        # Highest id read from the database by a refresh
+        self.watermark = 0
+        # Ids added locally above the watermark, skipped when a refresh reads them
+        self._added_ids = set()
+        self.loaded = False
+        self._last_refresh = 0.0
+        self._lock = asyncio.Lock()
+
+        self.samples = 0
+        self.missing_rows = 0
+
+    def _append(self, question_id, subject, difficulty):
+        ids = self.groups.get((subject, difficulty))
+        if ids is None:
+            ids = array('i')
+            self.groups[(subject, difficulty)] = ids
+        ids.append(question_id)
+
+    def add(self, question_id, subject, difficulty):
+        """Register a question inserted by this process"""
+        if question_id in self._added_ids:
+            return
+        if question_id <= self.watermark:
+            # Committed after a refresh read past it, unless that refresh already saw it
+            ids = self.groups.get((subject, difficulty))
+            if ids is not None and question_id in ids:
+                return
+        else:
+            self._added_ids.add(question_id)
+        self._append(question_id, subject, difficulty)
+
+    async def refresh(self):
+        """Load the ids of questions the sampler does not know yet (raises on database errors)"""
+        async with self._lock:
+            rows = await async_db.fetch_all(REFRESH_QUERY, (self.watermark,), raise_errors=True)
+            added = 0
+            for row in rows:
+                if row['id'] in self._added_ids:
+                    continue
+                self._append(row['id'], row['subject'], row['difficulty'])
+                added += 1
+            if rows:
+                self.watermark = rows[-1]['id']
+                self._added_ids = {question_id for question_id in self._added_ids
+                                   if question_id > self.watermark}
+            self.loaded = True
+            self._last_refresh = time.monotonic()
+        return added
+
+    async def warm_up(self):
+        added = await self.refresh()
+        print(f"✅ Question sampler ready: {added} question ids")
+
+    def _matching_groups(self, subject, difficulty):
+        return [
+            ids for (group_subject, group_difficulty), ids in self.groups.items()
+            if (subject is None or group_subject == subject)
+            and (difficulty is None or group_difficulty == difficulty)
+            and ids
+        ]
+
+    def sample_ids(self, count, subject=None, difficulty=None):
+        """Up to count distinct random question ids matching the filters"""
+        groups = self._matching_groups(subject, difficulty)
+
+        # Positions 0..total-1 span the matching arrays back to back
+        offsets = []
+        total = 0
+        for ids in groups:
+            offsets.append(total)
+            total += len(ids)
+
+        positions = random.sample(range(total), min(count, total))
+        sampled = []
+        for position in positions:
+            group = bisect_right(offsets, position) - 1
+            sampled.append(groups[group][position - offsets[group]])
+        return sampled
+
+    async def sample(self, count, subject=None, difficulty=None):
+        """Fetch up to count random question rows matching the filters"""
+        if not self.loaded or time.monotonic() - self._last_refresh > self.refresh_seconds:
+            try:
+                await self.refresh()
+            except Error as e:
+                # Keep sampling from the ids already known
+                print(f"⚠️ Question sampler refresh failed: {e}")
+
+        self.samples += 1
+        ids = self.sample_ids(count, subject, difficulty)
+        if not ids:
+            return []
+
+        rows = await async_db.fetch_all(sample_query(len(ids)), tuple(ids))
+
+        # Keep the random order of the sample
+        by_id = {row['id']: row for row in rows}
+        self.missing_rows += len(ids) - len(by_id)
+        return [by_id[question_id] for question_id in ids if question_id in by_id]
+
+    def stats(self):
+        return {
+            'groups': len(self.groups),
+            'question_ids': sum(len(ids) for ids in self.groups.values()),
+            'samples': self.samples,
+            'missing_rows': self.missing_rows
+        }
+
+
+# Global question sampler instance
+question_sampler = QuestionSampler()
@@ -0,0 +1,60 @@
+"""
+Component readiness
+Heavy components (database pool, inference workers, question bank, Groq
+client) are not built while the server starts. They warm up in the
+background after startup, and each one's state is tracked here for the
+readiness endpoint, so the process answers health checks right away while
+load balancers hold traffic back until everything is warm.
+"""
+
+import asyncio
+import time
+
+COLD = 'cold'
+WARMING = 'warming'
+WARM = 'warm'
+FAILED = 'failed'
+
+
+class Readiness:
+    def __init__(self):
+        # name -> {'state', 'seconds', 'error'}
+        self.components = {}
+
+    def register(self, name):
+        self.components.setdefault(name, {'state': COLD, 'seconds': None, 'error': None})
+
+    def mark(self, name, state, seconds=None, error=None):
+        self.components[name] = {
+            'state': state,
+            'seconds': round(seconds, 3) if seconds is not None else None,
+            'error': error
+        }
+
+    async def warm(self, name, warm_up):
+        """Await warm_up() and record how it went"""
+        self.mark(name, WARMING)
+        started = time.perf_counter()
+        try:
+            await warm_up()
+        except Exception as e:
+            self.mark(name, FAILED, time.perf_counter() - started, str(e))
+            print(f"❌ Warm-up of {name} failed: {e}")
+        else:
+            self.mark(name, WARM, time.perf_counter() - started)
+
+    async def warm_all(self, warm_ups):
+        """Warm several components concurrently, warm_ups maps name -> coroutine function"""
+        for name in warm_ups:
+            self.register(name)
+        await asyncio.gather(*[self.warm(name, warm_up) for name, warm_up in warm_ups.items()])
+
+    def is_ready(self):
+        return all(component['state'] == WARM for component in self.components.values())
+
+    def stats(self):
+        return {'ready': self.is_ready(), 'components': self.components}
+
+
+# Global readiness tracker
+readiness = Readiness()
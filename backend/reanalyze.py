@@ -0,0 +1,252 @@
+"""
+Offline re-analysis of recorded exam videos
+Re-runs face proctoring and object detection over recorded sessions, e.g.
+after a disputed result or a change of the FaceProctoring thresholds, and
+writes a violation timeline per exam in the shape of the violations table.
+
+Each video is split into contiguous segments that are analyzed in parallel
+by a process pool. Every worker opens the video itself and decodes only its
+own segment, so frames never cross a process boundary. Consecutive frames
+with the same violation are merged into episodes like the live debouncer
+does. Recordings whose header has no frame count (common for webm) get
+their duration measured by seeking, so they are split into segments too.
+
+Usage:
+    python reanalyze.py ../recordings/exam_42.webm
+    python reanalyze.py ../recordings/*.mp4 --fps 2 --output-dir ../timelines
+    python reanalyze.py session.mp4 --exam-id 42 --start 2024-05-01T09:00:00
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import cv2
+
+from episodes import merge_frames
+
+# Object detection batch size inside a segment
+DETECTION_BATCH = 8
+# Longest recording measure_duration probes for
+MAX_PROBE_SECONDS = 24 * 3600
+
+# Per-process state, populated by _init_worker inside each worker process
+_worker = {}
+
+
+def _init_worker():
+    """Load the object detector once per worker process"""
+    from object_detection import ObjectDetection
+    _worker['object_detection'] = ObjectDetection()
+
+
+def video_info(path):
+    """Frame rate and duration in seconds of a video file"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+    capture.release()
+    if frames > 0:
+        return fps, frames / fps
+    return fps, measure_duration(path)
+
+
+def measure_duration(path, precision=1.0):
+    """
+    Duration of a video without a frame count, found by seeking
+    Doubles the probed position until a seek lands past the end, then
+    bisects down to precision seconds. Returns 0.0 if the file cannot seek.
+    """
+    capture = cv2.VideoCapture(path)
+    try:
+        def readable(seconds):
+            capture.set(cv2.CAP_PROP_POS_MSEC, seconds * 1000)
+            # Some backends clamp a seek past the end to the last frame
+            return capture.grab() and capture.get(cv2.CAP_PROP_POS_MSEC) >= (seconds - precision) * 1000
+
+        if not capture.isOpened() or not readable(precision):
+            return 0.0
+
+        low, high = precision, 60.0
+        while high < MAX_PROBE_SECONDS and readable(high):
+            low, high = high, high * 2
+        while high - low > precision:
+            middle = (low + high) / 2
+            if readable(middle):
+                low = middle
+            else:
+                high = middle
+        return low
+    finally:
+        capture.release()
+
+
+def read_frames(path, sample_fps, start=0.0, end=None):
+    """
+    Yield (offset_seconds, BGR frame) sampled at sample_fps between start and end
+    Skipped frames are only grabbed, never converted to images
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        if start > 0:
+            capture.set(cv2.CAP_PROP_POS_MSEC, start * 1000)
+        index = int(round(start * fps))
+        step = max(1, int(round(fps / sample_fps)))
+
+        while capture.grab():
+            offset = index / fps
+            if end is not None and offset >= end:
+                break
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    yield offset, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def _analyze_segment(path, start, end, sample_fps):
+    """Analyze one segment of a video (executes in a worker)"""
+    from face_proctoring import FaceProctoring
+
+    # A fresh tracker per segment, its gaze state must not leak across gaps
+    face_proctoring = FaceProctoring()
+    object_detection = _worker['object_detection']
+    results = []
+    batch = []
+
+    def flush():
+        detections = object_detection.detect_objects_batch([frame for _, frame, _ in batch])
+        for (offset, _, violations), object_violations in zip(batch, detections):
+            object_summary = object_detection.get_violation_message(object_violations)
+            if object_summary:
+                violations.append(object_summary)
+            results.append((offset, violations))
+        batch.clear()
+
+    try:
+        for offset, frame in read_frames(path, sample_fps, start, end):
+            face_violations = face_proctoring.analyze_frame(frame)
+            face_summary = face_proctoring.get_violation_summary(face_violations)
+            batch.append((offset, frame, [face_summary] if face_summary else []))
+            if len(batch) >= DETECTION_BATCH:
+                flush()
+        if batch:
+            flush()
+    finally:
+        face_proctoring.close()
+    return results
+
+
+def build_timeline(exam_id, frames, started_at):
+    """Merge per-frame violations, ordered by offset, into violations rows"""
+    timed = ((started_at + timedelta(seconds=offset), violations) for offset, violations in frames)
+    return [
+        {
+            'exam_id': exam_id,
+            'violation_type': episode.violation_type,
+            'severity': episode.severity,
+            'description': episode.message,
+            'timestamp': episode.started_at.isoformat(sep=' ', timespec='seconds'),
+            'end_time': episode.last_seen.isoformat(sep=' ', timespec='seconds'),
+            'frame_count': episode.frame_count
+        }
+        for episode in merge_frames(timed)
+    ]
+
+
+def exam_id_for(path):
+    """First number in the file name, e.g. exam_42.webm -> 42"""
+    match = re.search(r'\d+', os.path.basename(path))
+    return int(match.group()) if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-run proctoring on recorded exam videos')
+    parser.add_argument('videos', nargs='+', help='recorded exam video files')
+    parser.add_argument('--fps', type=float, default=1.0, help='frames analyzed per second of video')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--segment', type=float, default=60.0, help='seconds of video per task')
+    parser.add_argument('--exam-id', type=int, help='exam id (default: first number in the file name)')
+    parser.add_argument('--start', help='recording start time, ISO format (default: file time minus duration)')
+    parser.add_argument('--output-dir', help='write exam_<id>_violations.json files here instead of stdout')
+    args = parser.parse_args()
+
+    if args.exam_id is not None and len(args.videos) > 1:
+        parser.error('--exam-id only applies to a single video')
+
+    jobs = {}
+    for path in args.videos:
+        exam_id = args.exam_id if args.exam_id is not None else exam_id_for(path)
+        _, duration = video_info(path)
+        if args.start:
+            started_at = datetime.fromisoformat(args.start)
+        else:
+            started_at = datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=duration)
+        jobs[path] = {'exam_id': exam_id, 'duration': duration, 'started_at': started_at, 'frames': []}
+
+    started = time.perf_counter()
+    # MediaPipe graphs are not fork-safe, always start clean interpreters
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                             initializer=_init_worker) as executor:
+        futures = {}
+        for path, job in jobs.items():
+            # A file that could not be measured is analyzed as one segment
+            segment = args.segment if job['duration'] else None
+            offset = 0.0
+            while True:
+                end = offset + segment if segment else None
+                if end is not None and end >= job['duration']:
+                    # The last segment reads on to the end of the file
+                    end = None
+                future = executor.submit(_analyze_segment, path, offset, end, args.fps)
+                futures[future] = path
+                if end is None:
+                    break
+                offset = end
+
+        for future in as_completed(futures):
+            jobs[futures[future]]['frames'].extend(future.result())
+    elapsed = time.perf_counter() - started
+
+    timelines = {}
+    for path, job in jobs.items():
+        job['frames'].sort(key=lambda item: item[0])
+        timelines[path] = {
+            'exam_id': job['exam_id'],
+            'frames_analyzed': len(job['frames']),
+            'violations': build_timeline(job['exam_id'], job['frames'], job['started_at'])
+        }
+
+    recorded = sum(job['duration'] for job in jobs.values())
+    print(f"Analyzed {recorded:.0f}s of video in {elapsed:.1f}s "
+          f"({recorded / elapsed if elapsed else 0:.1f}x real time)", file=sys.stderr)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for path, timeline in timelines.items():
+            name = os.path.splitext(os.path.basename(path))[0]
+            label = timeline['exam_id'] if timeline['exam_id'] is not None else name
+            with open(os.path.join(args.output_dir, f"exam_{label}_violations.json"), 'w') as f:
+                json.dump(timeline, f, indent=2)
+    else:
+        print(json.dumps(list(timelines.values()), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Server-side violation debouncing
+Consecutive frames with the same violation type are merged into a single
+episode with a start and end time, peak severity and frame count. A row is
+written to the violations table when an episode opens and updated once
+when it closes, instead of one row per violating frame.
+
+The INSERT and UPDATE are queued and written in order by a background task,
+so analyzing a frame never waits on the database. While the database is
+unreachable writes stay queued and are retried. An INSERT the database
+rejects is set aside as a dead letter and the episode's UPDATE is skipped.
+
+The gap after which an episode closes stretches with the capture interval
+an exam was last given, so slow capture under load does not split one
+violation into an episode per frame.
+"""
+
+import asyncio
+import os
+from collections import deque
+from datetime import datetime
+
+from mysql.connector import DataError, IntegrityError
+
+from database import async_db
+from episodes import SEVERITY_RANK, Episode
+from evidence import evidence
+
+# An episode survives at least this many missed capture intervals
+GAP_CAPTURE_INTERVALS = 3
+
+
+class ViolationDebouncer:
+    def __init__(self, gap_seconds=None, max_queue=None):
+        if gap_seconds is None:
+            gap_seconds = float(os.getenv('EPISODE_GAP_SECONDS', 10))
+        if max_queue is None:
+            max_queue = int(os.getenv('EPISODE_WRITE_QUEUE_MAX', 10000))
+
+        # An episode closes when its type is absent from a frame, or when
+        # no frame at all arrived for this long
+        self.gap_seconds = gap_seconds
+
+        # exam_id -> {violation_type: Episode}
+        self.open_episodes = {}
+        # exam_id -> asyncio.Lock, one exam's frames update its episodes in order
+        self._locks = {}
+        # exam_id -> seconds, gap stretched to the exam's capture interval
+        self._gaps = {}
+
+        # ('open' | 'close', exam_id, episode, evidence_id) in write order
+        self._writes = deque()
+        self.max_queue = max_queue
+        # Seconds to wait before retrying after the database went away
+        self.retry_interval = 1.0
+        # Most recent episodes the database rejected, kept for inspection
+        self.dead_letters = deque(maxlen=100)
+        self._wakeup = None
+        self._task = None
+
+        self.frames = 0
+        self.episodes_opened = 0
+        self.episodes_closed = 0
+        self.failed_writes = 0
+        self.dropped_writes = 0
+        self.rejected = 0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run_writes())
+
+    async def stop(self):
+        """Stop the write loop and write whatever is still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._writes:
+            print(f"⚠️ {len(self._writes)} episode writes could not be made on shutdown")
+
+    def _lock(self, exam_id):
+        lock = self._locks.get(exam_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[exam_id] = lock
+        return lock
+
+    def gap_for(self, exam_id):
+        return self._gaps.get(exam_id, self.gap_seconds)
+
+    async def observe(self, exam_id, violations, now=None, interval_ms=None):
+        """
+        Feed the violation summaries of one analyzed frame
+        interval_ms is the capture interval the exam was told to use next
+        """
+        now = now or datetime.now()
+        self.frames += 1
+        if interval_ms:
+            gap = max(self.gap_seconds, GAP_CAPTURE_INTERVALS * interval_ms / 1000)
+            if gap > self.gap_seconds:
+                self._gaps[exam_id] = gap
+            else:
+                self._gaps.pop(exam_id, None)
+        gap = self.gap_for(exam_id)
+
+        async with self._lock(exam_id):
+            episodes = self.open_episodes.setdefault(exam_id, {})
+
+            seen = set()
+            for violation in violations:
+                violation_type = violation['type']
+                seen.add(violation_type)
+
+                episode = episodes.get(violation_type)
+                if episode and (now - episode.last_seen).total_seconds() > gap:
+                    self._close(exam_id, episode)
+                    episode = None
+
+                if episode:
+                    episode.extend(violation['severity'], now)
+                else:
+                    episode = Episode(violation_type, violation['severity'], violation['message'], now)
+                    episodes[violation_type] = episode
+                    self._open(exam_id, episode)
+
+            for violation_type in list(episodes):
+                if violation_type not in seen:
+                    self._close(exam_id, episodes[violation_type])
+
+            if not episodes:
+                self.open_episodes.pop(exam_id, None)
+
+    async def close_exam(self, exam_id):
+        """Close every open episode of an exam, e.g. when it finishes"""
+        async with self._lock(exam_id):
+            for episode in list(self.open_episodes.get(exam_id, {}).values()):
+                self._close(exam_id, episode)
+            self.open_episodes.pop(exam_id, None)
+        self._locks.pop(exam_id, None)
+        self._gaps.pop(exam_id, None)
+
+    async def close_idle(self, now=None):
+        """Close episodes of exams that stopped sending frames"""
+        now = now or datetime.now()
+        for exam_id in list(self.open_episodes):
+            gap = self.gap_for(exam_id)
+            async with self._lock(exam_id):
+                for episode in list(self.open_episodes.get(exam_id, {}).values()):
+                    if (now - episode.last_seen).total_seconds() > gap:
+                        self._close(exam_id, episode)
+                if not self.open_episodes.get(exam_id):
+                    self.open_episodes.pop(exam_id, None)
+
+        # Forget the locks and gaps of exams with nothing open
+        for exam_id in [exam_id for exam_id, lock in self._locks.items()
+                        if exam_id not in self.open_episodes and not lock.locked()]:
+            del self._locks[exam_id]
+        for exam_id in [exam_id for exam_id in self._gaps if exam_id not in self.open_episodes]:
+            del self._gaps[exam_id]
+
+    def peak_severity(self, exam_id):
+        """Highest severity among the open episodes of an exam, or None"""
+        episodes = self.open_episodes.get(exam_id)
+        if not episodes:
+            return None
+        return max((episode.severity for episode in episodes.values()),
+                   key=lambda severity: SEVERITY_RANK.get(severity, 0))
+
+    async def run_sweeper(self):
+        """Periodically close idle episodes (runs as a background task)"""
+        while True:
+            await asyncio.sleep(self.gap_seconds)
+            await self.close_idle()
+
+    def _open(self, exam_id, episode):
+        # Frames leading up to the violation are stored in the background
+        evidence_id = evidence.capture(exam_id, episode.violation_type)
+        self._queue_write('open', exam_id, episode, evidence_id)
+        self.episodes_opened += 1
+
+    def _close(self, exam_id, episode):
+        self.open_episodes.get(exam_id, {}).pop(episode.violation_type, None)
+        self._queue_write('close', exam_id, episode, None)
+        self.episodes_closed += 1
+
+    def _queue_write(self, action, exam_id, episode, evidence_id):
+        self._writes.append((action, exam_id, episode, evidence_id))
+        if len(self._writes) > self.max_queue:
+            # The database is not keeping up, shed the oldest writes
+            self._writes.popleft()
+            self.dropped_writes += 1
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _run_writes(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not await self.flush():
+                await asyncio.sleep(self.retry_interval)
+                self._wakeup.set()
+
+    async def flush(self):
+        """Make the queued writes in order, False if the database went away"""
+        while self._writes:
+            action, exam_id, episode, evidence_id = self._writes[0]
+            try:
+                if action == 'open':
+                    await self._insert(exam_id, episode, evidence_id)
+                else:
+                    await self._update(episode)
+            except (IntegrityError, DataError) as e:
+                # The episode's UPDATE is skipped, its id stays None
+                self.rejected += 1
+                self.dead_letters.append({'exam_id': exam_id, 'type': episode.violation_type, 'error': str(e)})
+                print(f"⚠️ Violation episode rejected by the database: {e}")
+            except Exception as e:
+                # Database unreachable, keep the write queued and retry
+                self.failed_writes += 1
+                print(f"⚠️ Violation episode write failed, {len(self._writes)} writes queued: {e}")
+                return False
+            self._writes.popleft()
+        return True
+
+    async def _insert(self, exam_id, episode, evidence_id):
+        query = """
+        INSERT INTO violations (exam_id, violation_type, severity, description, timestamp, frame_count, evidence_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        cursor = await async_db.execute_query(query, (
+            exam_id,
+            episode.violation_type,
+            episode.severity,
+            episode.message,
+            episode.started_at,
+            episode.frame_count,
+            evidence_id
+        ), raise_errors=True)
+        episode.id = cursor.lastrowid
+
+    async def _update(self, episode):
+        if episode.id is None:
+            return
+
+        query = """
+        UPDATE violations
+        SET end_time = %s, severity = %s, frame_count = %s
+        WHERE id = %s
+        """
+        await async_db.execute_query(query, (
+            episode.last_seen,
+            episode.severity,
+            episode.frame_count,
+            episode.id
+        ), raise_errors=True)
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'open_episodes': sum(len(episodes) for episodes in self.open_episodes.values()),
+            'episodes_opened': self.episodes_opened,
+            'episodes_closed': self.episodes_closed,
+            'write_queue_depth': len(self._writes),
+            'failed_writes': self.failed_writes,
+            'dropped_writes': self.dropped_writes,
+            'rejected': self.rejected
+        }
+
+
+# Global violation debouncer instance
+violation_episodes = ViolationDebouncer()
@@ -0,0 +1,166 @@
+"""
+Batched violation writer
+Violation reports are queued in memory and written with one multi-row
+INSERT every VIOLATION_FLUSH_MS milliseconds, or as soon as
+VIOLATION_BATCH_SIZE rows are waiting, instead of one INSERT and commit
+per HTTP request.
+
+Rows are validated when they are queued. If a batch is still rejected by
+the database (e.g. an exam_id with no exam), it is retried row by row and
+only the offending rows are set aside as dead letters, so one bad report
+cannot hold back the rest of the queue. Batches are requeued only when the
+database is unreachable.
+"""
+
+import asyncio
+import os
+from collections import deque
+
+from mysql.connector import DataError, IntegrityError
+
+from database import async_db
+from timing import LatencyWindow
+
+
+class ViolationWriter:
+    def __init__(self, flush_interval_ms=None, batch_size=None, max_queue=None):
+        if flush_interval_ms is None:
+            flush_interval_ms = float(os.getenv('VIOLATION_FLUSH_MS', 500))
+        if batch_size is None:
+            batch_size = int(os.getenv('VIOLATION_BATCH_SIZE', 200))
+        if max_queue is None:
+            max_queue = int(os.getenv('VIOLATION_QUEUE_MAX', 10000))
+
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = max(1, batch_size)
+        self.max_queue = max_queue
+
+        self._rows = []
+        # Most recent rows the database rejected, kept for inspection
+        self.dead_letters = deque(maxlen=100)
+        self._wakeup = None
+        self._task = None
+
+        # Metrics
+        self.flush_time = LatencyWindow()
+        self.rows_written = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._rows:
+            print(f"⚠️ {len(self._rows)} violations could not be written on shutdown")
+
+    @staticmethod
+    def validate(exam_id, violation_type, severity, description):
+        """Raise ValueError for a row the violations table would reject"""
+        if not isinstance(exam_id, int) or isinstance(exam_id, bool) or exam_id <= 0:
+            raise ValueError("exam_id must be a positive integer")
+        if not isinstance(violation_type, str) or not violation_type or len(violation_type) > 100:
+            raise ValueError("violation_type must be a string of 1 to 100 characters")
+        if severity is not None and (not isinstance(severity, str) or len(severity) > 50):
+            raise ValueError("severity must be a string of at most 50 characters")
+        if description is not None and not isinstance(description, str):
+            raise ValueError("description must be a string")
+
+    def enqueue(self, exam_id, violation_type, severity, description):
+        """Queue one violation row, written by the next flush (ValueError if invalid)"""
+        self.validate(exam_id, violation_type, severity, description)
+        self._rows.append((exam_id, violation_type, severity, description))
+
+        if len(self._rows) > self.max_queue:
+            # The database is not keeping up, shed the oldest reports
+            overflow = len(self._rows) - self.max_queue
+            del self._rows[:overflow]
+            self.dropped += overflow
+
+        if len(self._rows) >= self.batch_size and self._wakeup:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write queued rows in batches of at most batch_size"""
+        while self._rows:
+            # Take the batch off the queue first, enqueue keeps running
+            # while the INSERT is awaited
+            batch = self._rows[:self.batch_size]
+            del self._rows[:len(batch)]
+            try:
+                await self._write(batch)
+            except (IntegrityError, DataError):
+                # Some row is bad, find it without giving up the others
+                if not await self._write_rows(batch):
+                    return
+                continue
+            except Exception as e:
+                # Database unreachable, put the rows back and retry on the next flush
+                print(f"⚠️ Violation flush failed, {len(batch)} rows requeued: {e}")
+                self._rows[:0] = batch
+                self.failed_flushes += 1
+                return
+            self.rows_written += len(batch)
+
+    async def _write_rows(self, rows):
+        """Insert rows one at a time, dead-lettering rejected ones; False if the database went away"""
+        for index, row in enumerate(rows):
+            try:
+                await self._write([row])
+            except (IntegrityError, DataError) as e:
+                self.rejected += 1
+                self.dead_letters.append({'row': row, 'error': str(e)})
+                print(f"⚠️ Violation rejected by the database: {e}")
+            except Exception as e:
+                print(f"⚠️ Violation flush failed, {len(rows) - index} rows requeued: {e}")
+                self._rows[:0] = rows[index:]
+                self.failed_flushes += 1
+                return False
+            else:
+                self.rows_written += 1
+        return True
+
+    async def _write(self, rows):
+        placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(rows))
+        query = f"""
+        INSERT INTO violations (exam_id, violation_type, severity, description)
+        VALUES {placeholders}
+        """
+        params = [value for row in rows for value in row]
+
+        with self.flush_time.time():
+            await async_db.execute_query(query, params, raise_errors=True)
+
+    def stats(self):
+        return {
+            'queue_depth': len(self._rows),
+            'rows_written': self.rows_written,
+            'failed_flushes': self.failed_flushes,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'flush_latency': self.flush_time.summary()
+        }
+
+
+# Global violation writer instance
+violation_writer = ViolationWriter()
@@ -38,6 +38,16 @@ let submittingAnswers = new Set();
 let lastSubmittedAnswer = null;
 let lastSubmittedTime = 0;
 let clickTimeout = null;
+
+// NEW: Proctoring frame stream
+const MAX_SOCKET_BUFFERED_BYTES = 512 * 1024;
+let proctorSocket = null;
+
+// Frame size and encoding requested by the server (/api/proctor/profile)
+let captureProfile = { max_side: 640, jpeg_quality: 0.7, grayscale: false };
+
+// NEW: Capture interval recommended by the server
+let captureIntervalMs = 3000;
 // Utility functions
 function showPage(pageId) {
     document.querySelectorAll('[id$="Page"]').forEach(page => {
@@ -402,6 +412,9 @@ async function analyzeFrame(imageBlob) {
     try {
         const formData = new FormData();
         formData.append('file', imageBlob, 'frame.jpg');
+        if (currentExam) {
+            formData.append('exam_id', currentExam.exam_id);
+        }
         
         const response = await fetch(`${API_URL}/api/proctor/analyze`, {
             method: 'POST',
@@ -410,7 +423,17 @@ async function analyzeFrame(imageBlob) {
         
         if (response.ok) {
             const data = await response.json();
+            applyCaptureInterval(data);
             handleViolations(data);
+        } else if (response.status === 503 || response.status === 429) {
+            // Server is shedding load, wait before the next frame
+            const retryAfter = response.headers.get('Retry-After');
+            if (retryAfter) {
+                applyRetryAfter(Number(retryAfter));
+            } else {
+                const data = await response.json().catch(() => ({}));
+                applyRetryAfter(Number(data.retry_after));
+            }
         }
     } catch (error) {
         console.error('Proctoring analysis failed:', error);
@@ -418,6 +441,16 @@ async function analyzeFrame(imageBlob) {
 }
 
 async function logViolation(type, severity, description) {
+    if (isProctorSocketOpen()) {
+        proctorSocket.send(JSON.stringify({
+            type: 'violation',
+            violation_type: type,
+            severity: severity,
+            description: description
+        }));
+        return;
+    }
+    
     try {
         const formData = new FormData();
         formData.append('exam_id', currentExam.exam_id);
@@ -607,15 +640,84 @@ async function initializeCamera() {
     }
 }
 
-function startProctoring() {
-    proctoringInterval = setInterval(() => {
+function connectProctorSocket() {
+    if (!currentExam || !('WebSocket' in window)) {
+        return;
+    }
+    
+    const socketUrl = `${API_URL.replace(/^http/, 'ws')}/ws/proctor/${currentExam.exam_id}`;
+    proctorSocket = new WebSocket(socketUrl);
+    
+    proctorSocket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === 'analysis') {
+            applyCaptureInterval(data);
+            handleViolations(data);
+        } else if (data.type === 'throttled') {
+            applyRetryAfter(data.retry_after);
+        } else if (data.type === 'error') {
+            console.error('Proctoring analysis failed:', data.detail);
+        }
+    };
+    
+    // Fall back to HTTP uploads if the stream goes away
+    proctorSocket.onclose = () => {
+        proctorSocket = null;
+    };
+}
+
+function isProctorSocketOpen() {
+    return proctorSocket !== null && proctorSocket.readyState === WebSocket.OPEN;
+}
+
+function applyCaptureInterval(data) {
+    if (data.next_capture_ms) {
+        captureIntervalMs = data.next_capture_ms;
+    }
+}
+
+function applyRetryAfter(seconds) {
+    if (seconds > 0) {
+        captureIntervalMs = Math.max(captureIntervalMs, seconds * 1000);
+    }
+}
+
+function scheduleCapture() {
+    proctoringInterval = setTimeout(() => {
         captureAndAnalyze();
-    }, 3000);
+        scheduleCapture();
+    }, captureIntervalMs);
+}
+
+async function loadCaptureProfile() {
+    try {
+        const response = await fetch(`${API_URL}/api/proctor/profile`);
+        if (response.ok) {
+            captureProfile = await response.json();
+            if (captureProfile.interval_ms) {
+                captureIntervalMs = captureProfile.interval_ms;
+            }
+        }
+    } catch (error) {
+        console.error('Failed to load capture profile, using defaults:', error);
+    }
+}
+
+async function startProctoring() {
+    await loadCaptureProfile();
+    connectProctorSocket();
+    scheduleCapture();
 }
 
 function stopProctoring() {
     if (proctoringInterval) {
-        clearInterval(proctoringInterval);
+        clearTimeout(proctoringInterval);
+        proctoringInterval = null;
+    }
+    
+    if (proctorSocket) {
+        proctorSocket.close();
+        proctorSocket = null;
     }
     
     if (videoStream) {
@@ -628,20 +730,33 @@ async function captureAndAnalyze() {
     const canvas = document.getElementById('canvas');
     const context = canvas.getContext('2d');
     
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
-    context.drawImage(video, 0, 0);
+    // Downscale to what the models consume instead of full camera resolution
+    const scale = Math.min(1, captureProfile.max_side / Math.max(video.videoWidth, video.videoHeight));
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
+    context.filter = captureProfile.grayscale ? 'grayscale(1)' : 'none';
+    context.drawImage(video, 0, 0, canvas.width, canvas.height);
     
     canvas.toBlob(async (blob) => {
+        if (isProctorSocketOpen()) {
+            // Drop this frame if the previous ones have not been sent yet
+            if (proctorSocket.bufferedAmount < MAX_SOCKET_BUFFERED_BYTES) {
+                proctorSocket.send(blob);
+            }
+            return;
+        }
         await analyzeFrame(blob);
-    }, 'image/jpeg', 0.8);
+    }, 'image/jpeg', captureProfile.jpeg_quality);
 }
 
 function handleViolations(data) {
     if (data.violations && data.violations.length > 0) {
         data.violations.forEach(violation => {
             addViolation(violation);
-            logViolation(violation.type, violation.severity, violation.message);
+            // The server records violations of an exam as episodes itself
+            if (!data.logged) {
+                logViolation(violation.type, violation.severity, violation.message);
+            }
             
             violationCount.total++;
             if (violation.severity === 'high') {
@@ -1,4 +1,6 @@
 -- Database setup for AI Proctoring System
+-- Fresh-install snapshot of backend/migrations; to create or upgrade a
+-- database in place run: cd backend && python migrate.py
 CREATE DATABASE IF NOT EXISTS proctoring_db;
 USE proctoring_db;
 
@@ -25,6 +27,7 @@ CREATE TABLE IF NOT EXISTS questions (
     difficulty VARCHAR(50),
     created_by INT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_questions_subject_difficulty (subject, difficulty),
     FOREIGN KEY (created_by) REFERENCES users(id)
 );
 
@@ -38,6 +41,7 @@ CREATE TABLE IF NOT EXISTS exams (
     total_questions INT DEFAULT 20,
     score FLOAT DEFAULT 0,
     status VARCHAR(50) DEFAULT 'in_progress',
+    INDEX idx_exams_user_status_start (user_id, status, start_time),
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
@@ -49,6 +53,7 @@ CREATE TABLE IF NOT EXISTS user_answers (
     user_answer CHAR(1),
     is_correct BOOLEAN,
     answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_user_answers_exam (exam_id, answered_at),
     FOREIGN KEY (exam_id) REFERENCES exams(id),
     FOREIGN KEY (question_id) REFERENCES questions(id)
 );
@@ -61,6 +66,10 @@ CREATE TABLE IF NOT EXISTS violations (
     severity VARCHAR(50),
     description TEXT,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    end_time TIMESTAMP NULL,
+    frame_count INT DEFAULT 1,
+    evidence_id VARCHAR(32) NULL,
+    INDEX idx_violations_exam_time (exam_id, timestamp),
     FOREIGN KEY (exam_id) REFERENCES exams(id)
 );
 
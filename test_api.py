@@ -193,6 +193,33 @@ def test_generate_questions():
         print(f"❌ FAILED: {e}")
         return False
 
+def test_metrics():
+    print_test("Metrics Endpoint")
+    try:
+        response = requests.get(f"{BASE_URL}/metrics")
+        print(f"Status: {response.status_code}")
+        assert response.status_code == 200
+        assert "# TYPE http_request_seconds histogram" in response.text
+        print("✅ PASSED")
+        return True
+    except Exception as e:
+        print(f"❌ FAILED: {e}")
+        return False
+
+def test_ready():
+    print_test("Readiness Endpoint")
+    try:
+        response = requests.get(f"{BASE_URL}/api/ready")
+        print(f"Status: {response.status_code}")
+        print(f"Response: {response.json()}")
+        assert response.status_code in (200, 503)
+        assert "inference_pool" in response.json()["components"]
+        print("✅ PASSED")
+        return True
+    except Exception as e:
+        print(f"❌ FAILED: {e}")
+        return False
+
 def main():
     print("\n" + "="*60)
     print("AI PROCTORING SYSTEM - API TEST SUITE")
@@ -290,6 +317,20 @@ def main():
     else:
         results["failed"] += 1
     
+    sleep(0.5)
+    
+    # Test 11: Metrics
+    if test_metrics():
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
+    # Test 12: Readiness
+    if test_ready():
+        results["passed"] += 1
+    else:
+        results["failed"] += 1
+    
     # Print summary
     print("\n" + "="*60)
     print("TEST SUMMARY")